@@ -63,6 +63,94 @@ def numericInputFrame(parent, label, tooltip, minimum, maximum, step, decimals):
   inputFrame.layout().addWidget(inputSlider)
   return inputFrame, inputSlider, inputSpinBox
 
+# =====================================================
+#
+# VTK 5/6 pipeline compatibility
+#
+def _setInput(algorithm, data):
+  if hasattr(algorithm, 'SetInputData'):
+    algorithm.SetInputData(data)
+  else:
+    algorithm.SetInput(data)
+
+def _addInput(algorithm, data):
+  if hasattr(algorithm, 'AddInputData'):
+    algorithm.AddInputData(data)
+  else:
+    algorithm.AddInput(data)
+
+# =====================================================
+#
+# MosaicViewerState
+#
+class MosaicViewerState(object):
+  """
+  Typed parameters of the mosaic viewer. Assigning a field coerces the
+  value to its declared type and notifies the observers only when the
+  value actually changed.
+  """
+  # (name, type, default)
+  fields = (('layoutMethod',      str,   'Default'),
+            ('nRows',             int,   1),
+            ('nColumns',          int,   1),
+            ('livePreview',       bool,  False),
+            ('throttleRendering', bool,  False),
+            ('idleRendering',     str,   'throttle'),
+            ('idleRate',          float, 2.0),
+            ('shareSlicePlanes',  bool,  False),
+            ('subsampleFibers',   bool,  False))
+
+  # ---------------------------
+  def __init__(self):
+    object.__setattr__(self, '_observers', [])
+    self.reset()
+
+  # ---------------------------
+  def __setattr__(self, name, value):
+    for fieldName, fieldType, default in self.fields:
+      if fieldName == name:
+        break
+    else:
+      raise AttributeError('Unknown state field: %s' % name)
+
+    # values coming from the double sliders/spin boxes are floats
+    if fieldType is int:
+      value = int(round(value))
+    else:
+      value = fieldType(value)
+
+    if name in self.__dict__ and self.__dict__[name] == value:
+      return
+    object.__setattr__(self, name, value)
+    for callback in list(self._observers):
+      callback(name, value)
+
+  # ---------------------------
+  def addObserver(self, callback):
+    """callback(name, value) is called after every effective change"""
+    if callback not in self._observers:
+      self._observers.append(callback)
+
+  # ---------------------------
+  def removeObserver(self, callback):
+    if callback in self._observers:
+      self._observers.remove(callback)
+
+  # ---------------------------
+  def reset(self):
+    """restore the default value of every field"""
+    for fieldName, fieldType, default in self.fields:
+      setattr(self, fieldName, default)
+
+  # ---------------------------
+  def toDict(self):
+    return dict((fieldName, getattr(self, fieldName)) for fieldName, fieldType, default in self.fields)
+
+  # ---------------------------
+  def update(self, values):
+    for fieldName, value in values.items():
+      setattr(self, fieldName, value)
+
 
 #=======================================================
 #
@@ -73,6 +161,9 @@ class MosaicViewerWidget:
   def __init__(self, parent = None):
     self.developerMode = True # change this to 'True' to get reload and test
     self.state = None
+    self.logic = None
+    self.previewTimer = None
+    self.previewInterval = 250 # ms between two live preview layouts
     if not parent:
       self.parent = slicer.qMRMLWidget()
       self.parent.setLayout(qt.QVBoxLayout())
@@ -111,11 +202,18 @@ class MosaicViewerWidget:
       reloadFormLayout.addWidget(self.reloadButton)
       self.reloadButton.connect('clicked()', self.onReload)
 
+      # reload the code but keep the current mosaic and parameters,
+      # so the views do not have to be rebuilt with Apply
+      self.reloadKeepButton         = qt.QPushButton("Reload (Keep Mosaic)")
+      self.reloadKeepButton.toolTip = "Reload this Mosaic Viewer and carry the current mosaic over"
+      reloadFormLayout.addWidget(self.reloadKeepButton)
+      self.reloadKeepButton.connect('clicked()', lambda: self.onReload(keepMosaic = True))
+
       # reload and test button
       # (use this during development, but remove it when delivering your module to users)
       # reload and run specific tests
       # scenarios                     = ('All', 'Model', 'Volume', 'sceneViewSimple', 'sceneViewComplex')
-      scenarios                     = ('sceneViewSimple', 'sceneViewComplex', 'syncCam')
+      scenarios                     = ('state', 'sceneViewSimple', 'sceneViewComplex', 'reloadKeepMosaic', 'syncCam', 'syncGroup', 'session', 'renderScheduler', 'sharedSlices', 'fibers', 'animation', 'visibility')
 
       for scenario in scenarios:
         button                      = qt.QPushButton("Reload and Test %s" % scenario)
@@ -172,45 +270,154 @@ class MosaicViewerWidget:
     self.syncCamSelector.setToolTip( "Pick the view to be synchronised." )
     syncCamLayout.addRow("View to synchronise", self.syncCamSelector) 
 
+    self.syncModeSelector         = qt.QComboBox(syncCamCollapsibleButtion)
+    self.syncModeSelector.toolTip = "Synchronise the full camera, only its rotation or only its zoom"
+    for mode in MosaicViewerLogic.syncModes:
+      self.syncModeSelector.addItem(mode.capitalize())
+    syncCamLayout.addRow("Synchronise", self.syncModeSelector)
+
+    # link the selected view to a named group, Sync Camera then only updates that group
+    syncGroupFrame                 = qt.QFrame(syncCamCollapsibleButtion)
+    syncGroupFrame.setLayout(qt.QHBoxLayout())
+    self.syncGroupEdit             = qt.QLineEdit(syncGroupFrame)
+    self.syncGroupEdit.toolTip     = "Name of the sync group of the view"
+    self.syncGroupEdit.text        = "group1"
+    syncGroupFrame.layout().addWidget(self.syncGroupEdit)
+    self.linkViewButton            = qt.QPushButton("Link View", syncGroupFrame)
+    self.linkViewButton.toolTip    = "Add the view to the sync group, out of any other group"
+    syncGroupFrame.layout().addWidget(self.linkViewButton)
+    self.unlinkViewButton          = qt.QPushButton("Unlink View", syncGroupFrame)
+    self.unlinkViewButton.toolTip  = "Take the view out of its sync group"
+    syncGroupFrame.layout().addWidget(self.unlinkViewButton)
+    syncCamLayout.addRow("Sync group", syncGroupFrame)
+    self.linkViewButton.connect('clicked()', self.onLinkView)
+    self.unlinkViewButton.connect('clicked()', self.onUnlinkView)
+
     self.syncCamButton         = qt.QPushButton("Sync Camera")
-    self.syncCamButton.toolTip = "Sync all the cameras"
+    self.syncCamButton.toolTip = "Sync the cameras of the mosaic, or of the sync group of the view"
     self.syncCamButton.name    = "MosaicViewer syncCam"
     syncCamLayout.addRow(self.syncCamButton)
     self.syncCamButton.connect('clicked()', self.onsyncCam)
 
-    class state(object):
-      layoutMethod  = 'Default'
-      nRows         = 1
-      nColumns      = 1
+    livePreviewCheckBox         = qt.QCheckBox("Live Preview")
+    livePreviewCheckBox.toolTip = "Re-layout the mosaic while dragging the number of rows and columns"
+    changeLayoutFormLayout.addWidget(livePreviewCheckBox)
+
+    #
+    # Rendering Area
+    #
+    renderingCollapsibleButton      = ctk.ctkCollapsibleButton()
+    renderingCollapsibleButton.text = "Rendering"
+    self.layout.addWidget(renderingCollapsibleButton)
+    renderingLayout                 = qt.QFormLayout(renderingCollapsibleButton)
+
+    throttleCheckBox                = qt.QCheckBox("Throttle Idle Views")
+    throttleCheckBox.toolTip        = "Only the view under the mouse renders at full rate"
+    renderingLayout.addRow(throttleCheckBox)
+
+    idleRenderingSelector           = qt.QComboBox(renderingCollapsibleButton)
+    idleRenderingSelector.toolTip   = "Render the idle views at the idle rate, or only once the interaction stops"
+    for mode in MosaicRenderScheduler.modes:
+      idleRenderingSelector.addItem(mode)
+    renderingLayout.addRow("Idle views", idleRenderingSelector)
+
+    idleRateFrame, idleRateSlider, idleRateSpinBox = numericInputFrame(self.parent,
+                                                     "Idle Rate (fps):", "Rendering rate of the idle views", 0.1, 30, 0.1, 1)
+    renderingLayout.addWidget(idleRateFrame)
+
+    shareSlicesCheckBox             = qt.QCheckBox("Share Slice Planes")
+    shareSlicesCheckBox.toolTip     = "Reslice each slice position once and share it between the views (applied by Apply)"
+    renderingLayout.addRow(shareSlicesCheckBox)
 
-    scopeLocals    = locals()
+    subsampleFibersCheckBox         = qt.QCheckBox("Subsample Tractography")
+    subsampleFibersCheckBox.toolTip = "Show fewer streamlines in small views, full density in the focused view (applied by Apply)"
+    renderingLayout.addRow(subsampleFibersCheckBox)
 
-    def connect(obj, evt, cmd):
-      def callback(*args):
-        currentLocals = scopeLocals.copy()
-        currentLocals.update({'args':args})
-        exec cmd in globals(), currentLocals
-        updateGUI()
-      obj.connect(evt, callback)
+    state = MosaicViewerState()
 
     def updateGUI():
+      chooseDefault.checked           = state.layoutMethod == "Default"
+      chooseCustomized.checked        = state.layoutMethod == "Customized"
       chooseRowFrame.visible          = state.layoutMethod == "Customized"
       chooseColumnFrame.visible       = state.layoutMethod == "Customized"
-      chooseRowSlider.value           = state.nRows
-      chooseRowSliderSpinBox.value    = state.nRows
-      chooseColumnSlider.value        = state.nColumns
-      chooseColumnSliderSpinBox.value = state.nColumns
-
-    connect(chooseDefault, 'clicked(bool)', 'state.layoutMethod = "Default"')
-    connect(chooseCustomized, 'clicked(bool)', 'state.layoutMethod = "Customized"')    
-    connect(chooseRowSlider, 'valueChanged(double)', 'state.nRows = args[0]')
-    connect(chooseRowSliderSpinBox, 'valueChanged(double)', 'state.nRows = args[0]')
-    connect(chooseColumnSlider, 'valueChanged(double)', 'state.nColumns = args[0]')
-    connect(chooseColumnSliderSpinBox, 'valueChanged(double)', 'state.nColumns = args[0]')
+      livePreviewCheckBox.checked     = state.livePreview
+      throttleCheckBox.checked        = state.throttleRendering
+      shareSlicesCheckBox.checked     = state.shareSlicePlanes
+      subsampleFibersCheckBox.checked = state.subsampleFibers
+      idleRenderingSelector.currentIndex = MosaicRenderScheduler.modes.index(state.idleRendering)
+      idleRateFrame.visible           = state.throttleRendering and state.idleRendering == 'throttle'
+      # block the signals so the sliders and the spin boxes do not echo into each other
+      for widget, value in ((chooseRowSlider, state.nRows), (chooseRowSliderSpinBox, state.nRows),
+                            (chooseColumnSlider, state.nColumns), (chooseColumnSliderSpinBox, state.nColumns),
+                            (idleRateSlider, state.idleRate), (idleRateSpinBox, state.idleRate)):
+        wasBlocked   = widget.blockSignals(True)
+        widget.value = value
+        widget.blockSignals(wasBlocked)
+
+    # re-layout at most once per interval while the grid sliders are dragged
+    self.previewTimer            = qt.QTimer()
+    self.previewTimer.singleShot = True
+    self.previewTimer.interval   = self.previewInterval
+    self.previewTimer.connect('timeout()', self.onApply)
+
+    def onStateChanged(name, value):
+      updateGUI()
+      if name in ('layoutMethod', 'nRows', 'nColumns') and state.livePreview \
+         and not self.previewTimer.active:
+        self.previewTimer.start()
+      if name in ('throttleRendering', 'idleRendering'):
+        self.updateRenderScheduler()
+      elif name == 'idleRate' and self.logic.renderScheduler is not None:
+        self.logic.renderScheduler.setIdleRate(value)
+
+    def setter(name):
+      return lambda value: setattr(state, name, value)
+
+    chooseDefault.connect('clicked(bool)', lambda checked: setattr(state, 'layoutMethod', 'Default'))
+    chooseCustomized.connect('clicked(bool)', lambda checked: setattr(state, 'layoutMethod', 'Customized'))
+    livePreviewCheckBox.connect('toggled(bool)', setter('livePreview'))
+    chooseRowSlider.connect('valueChanged(double)', setter('nRows'))
+    chooseRowSliderSpinBox.connect('valueChanged(double)', setter('nRows'))
+    chooseColumnSlider.connect('valueChanged(double)', setter('nColumns'))
+    chooseColumnSliderSpinBox.connect('valueChanged(double)', setter('nColumns'))
+    throttleCheckBox.connect('toggled(bool)', setter('throttleRendering'))
+    idleRenderingSelector.connect('currentIndexChanged(int)',
+                                  lambda index: setattr(state, 'idleRendering', MosaicRenderScheduler.modes[index]))
+    idleRateSlider.connect('valueChanged(double)', setter('idleRate'))
+    idleRateSpinBox.connect('valueChanged(double)', setter('idleRate'))
+    shareSlicesCheckBox.connect('toggled(bool)', setter('shareSlicePlanes'))
+    subsampleFibersCheckBox.connect('toggled(bool)', setter('subsampleFibers'))
+    state.addObserver(onStateChanged)
 
     updateGUI()
     self.updateGUI  = updateGUI
     self.state      = state
+    self.chooseRowSlider        = chooseRowSlider
+    self.chooseRowSliderSpinBox = chooseRowSliderSpinBox
+    self.logic      = MosaicViewerLogic()
+
+    #
+    # Session Area
+    #
+    sessionCollapsibleButton      = ctk.ctkCollapsibleButton()
+    sessionCollapsibleButton.text = "Mosaic Session"
+    self.layout.addWidget(sessionCollapsibleButton)
+    sessionLayout                 = qt.QFormLayout(sessionCollapsibleButton)
+
+    self.exportSessionButton         = qt.QPushButton("Export Session")
+    self.exportSessionButton.toolTip = "Save the current mosaic so that it reopens without scanning the scene views"
+    sessionLayout.addRow(self.exportSessionButton)
+    self.exportSessionButton.connect('clicked()', self.onExportSession)
+
+    self.loadSessionButton           = qt.QPushButton("Open Session")
+    self.loadSessionButton.toolTip   = "Reopen a mosaic saved with Export Session"
+    sessionLayout.addRow(self.loadSessionButton)
+    self.loadSessionButton.connect('clicked()', self.onLoadSession)
+
+    self.exportAnimationButton         = qt.QPushButton("Export Orbit Animation")
+    self.exportAnimationButton.toolTip = "Orbit all the views in lockstep and save the mosaic as images or a video"
+    sessionLayout.addRow(self.exportAnimationButton)
+    self.exportAnimationButton.connect('clicked()', self.onExportAnimation)
 
     #
     # Execution Area
@@ -238,15 +445,24 @@ class MosaicViewerWidget:
     slicer.mrmlScene.Clear(0)
 
   # ----------------------------------------------
-  def onReload(self, moduleName = "MosaicViewer"):
+  def onReload(self, moduleName = "MosaicViewer", keepMosaic = False):
     """
     Generic reload method for any scripted module.
     ModuleWizard will subsitute correct default moduleName.
+    With keepMosaic the parameters and the views of the current mosaic
+    are handed over to the reloaded widget instead of being rebuilt.
     """
     import imp, sys, os, slicer
 
     widgetName = moduleName + "Widget"
 
+    if keepMosaic:
+      stateValues = self.state.toDict()
+      mosaic      = self.logic.mosaicSnapshot()
+
+    # the reloaded widget comes with its own logic, detach this one from the scene
+    self.cleanup(keepMosaic = keepMosaic)
+
     # reload the source code
     # - set source f path
     # - load the module to the global space
@@ -278,6 +494,21 @@ class MosaicViewerWidget:
     globals()[widgetName.lower()] = eval('globals()["%s"].%s(parent)' % (moduleName, widgetName))
     globals()[widgetName.lower()].setup()
 
+    if keepMosaic:
+      newWidget = globals()[widgetName.lower()]
+      newWidget.state.update(stateValues)
+      newWidget.logic.restoreMosaicSnapshot(mosaic)
+      newWidget.updateRenderScheduler()
+
+  # ---------------------------------------------
+  def cleanup(self, keepMosaic = False):
+    """called by onReload and when the module is torn down"""
+    # a pending live preview would apply on the logic cleaned up below
+    if self.previewTimer is not None:
+      self.previewTimer.stop()
+    if self.logic is not None:
+      self.logic.cleanup(keepMosaic = keepMosaic)
+
   # ---------------------------------------------
   def onReloadAndTest(self, moduleName = "MosaicViewer", scenario = None):
     try:
@@ -293,23 +524,737 @@ class MosaicViewerWidget:
 
   #------------------------------------
   def onsyncCam(self):
-    logic = MosaicViewerLogic()
-    logic.syncCam(self.syncCamSelector.currentNode())
+    self.logic.syncCam(self.syncCamSelector.currentNode(),
+                       mode = MosaicViewerLogic.syncModes[self.syncModeSelector.currentIndex])
+
+  #------------------------------------
+  def onLinkView(self):
+    view = self.syncCamSelector.currentNode()
+    if view is not None and self.syncGroupEdit.text:
+      self.logic.linkView(self.syncGroupEdit.text, view)
+
+  #------------------------------------
+  def onUnlinkView(self):
+    view = self.syncCamSelector.currentNode()
+    if view is not None:
+      self.logic.unlinkView(view)
+
+  # ------------------------------------
+  def onExportSession(self):
+    fileName = qt.QFileDialog.getSaveFileName(self.parent, "Export Mosaic Session", "",
+                                              "Mosaic Session (*.json)")
+    if fileName:
+      self.logic.exportSession(fileName)
+
+  # ------------------------------------
+  def onLoadSession(self):
+    fileName = qt.QFileDialog.getOpenFileName(self.parent, "Open Mosaic Session", "",
+                                              "Mosaic Session (*.json)")
+    if fileName:
+      self.logic.loadSession(fileName)
+
+  # ------------------------------------
+  def onExportAnimation(self):
+    fileName = qt.QFileDialog.getSaveFileName(self.parent, "Export Orbit Animation", "",
+                                              "Image Sequence (*.png *.jpg);;Video (*.avi *.mp4)")
+    if fileName:
+      self.logic.exportAnimation(fileName)
 
   # -----------------------------------
   def onRestore(self):
-    self.onReload("MosaicViewer")
+    # reset in place, the observers of the state refresh the GUI
+    self.state.reset()
+    self.previewTimer.stop()
 
   # ------------------------------------
   def onApply(self):
-    logic = MosaicViewerLogic()
-    logic.renderAllSceneViewNodes(self.state)
+    self.logic.renderAllSceneViewNodes(self.state)
+    self.updateRenderScheduler()
+
+  # ------------------------------------
+  def updateRenderScheduler(self):
+    if self.state.throttleRendering:
+      self.logic.startRenderScheduler(idleRate = self.state.idleRate, mode = self.state.idleRendering)
+    else:
+      self.logic.stopRenderScheduler()
+
+# ============================================================
+#
+# MosaicCameraIndex
+#
+class MosaicCameraIndex:
+  """
+  View node ID -> camera node index kept current by scene observers,
+  so that finding the camera of a view does not scan every camera node
+  """
+  # -------------------------------
+  def __init__(self, scene = None):
+    self.scene           = scene if scene is not None else slicer.mrmlScene
+    self.cameras         = {} # View Node ID -> Camera Node
+    self.viewIDs         = {} # Camera Node ID -> View Node ID
+    self.cameraObservers = {} # Camera Node ID -> (Camera Node, observer tag)
+    self.sceneObservers  = []
+    for event, callback in ((slicer.vtkMRMLScene.NodeAddedEvent, self.onNodeAdded),
+                            (slicer.vtkMRMLScene.NodeRemovedEvent, self.onNodeRemoved),
+                            (slicer.vtkMRMLScene.EndCloseEvent, self.onSceneClosed)):
+      self.sceneObservers.append(self.scene.AddObserver(event, callback))
+    self.rebuild()
+
+  # -------------------------------
+  def cleanup(self):
+    for tag in self.sceneObservers:
+      self.scene.RemoveObserver(tag)
+    self.sceneObservers = []
+    self._clear()
+
+  # -------------------------------
+  def rebuild(self):
+    self._clear()
+    cameraCollection = self.scene.GetNodesByClass('vtkMRMLCameraNode')
+    for c in range(cameraCollection.GetNumberOfItems()):
+      self._addCamera(cameraCollection.GetItemAsObject(c))
+
+  # -------------------------------
+  def cameraForView(self, view):
+    """view can be a view node or its ID"""
+    viewID = view if isinstance(view, basestring) else view.GetID()
+    return self.cameras.get(viewID)
+
+  # -------------------------------
+  def _clear(self):
+    for cam, tag in self.cameraObservers.values():
+      cam.RemoveObserver(tag)
+    self.cameras         = {}
+    self.viewIDs         = {}
+    self.cameraObservers = {}
+
+  # -------------------------------
+  def _addCamera(self, cam):
+    if cam.GetID() in self.cameraObservers:
+      return
+    tag = cam.AddObserver(slicer.vtkMRMLCameraNode.ActiveTagModifiedEvent, self.onActiveTagModified)
+    self.cameraObservers[cam.GetID()] = (cam, tag)
+    self._indexCamera(cam)
+
+  # -------------------------------
+  def _removeCamera(self, cam):
+    cameraID = cam.GetID()
+    if cameraID in self.cameraObservers:
+      observed, tag = self.cameraObservers.pop(cameraID)
+      observed.RemoveObserver(tag)
+    viewID = self.viewIDs.pop(cameraID, None)
+    if viewID is not None and self.cameras.get(viewID) is cam:
+      del self.cameras[viewID]
+
+  # -------------------------------
+  def _indexCamera(self, cam):
+    cameraID  = cam.GetID()
+    oldViewID = self.viewIDs.pop(cameraID, None)
+    if oldViewID is not None and self.cameras.get(oldViewID) is cam:
+      del self.cameras[oldViewID]
+    viewID = cam.GetActiveTag()
+    if viewID:
+      self.cameras[viewID]   = cam
+      self.viewIDs[cameraID] = viewID
+
+  # -------------------------------
+  @vtk.calldata_type(vtk.VTK_OBJECT)
+  def onNodeAdded(self, caller, event, node):
+    if node is not None and node.IsA('vtkMRMLCameraNode'):
+      self._addCamera(node)
+
+  # -------------------------------
+  @vtk.calldata_type(vtk.VTK_OBJECT)
+  def onNodeRemoved(self, caller, event, node):
+    if node is not None and node.IsA('vtkMRMLCameraNode'):
+      self._removeCamera(node)
+
+  # -------------------------------
+  def onActiveTagModified(self, cam, event):
+    self._indexCamera(cam)
+
+  # -------------------------------
+  def onSceneClosed(self, caller, event):
+    self.rebuild()
+
+# ============================================================
+#
+# MosaicRenderScheduler
+#
+class MosaicRenderScheduler:
+  """
+  Render on demand for the views of a mosaic. The view under the mouse
+  renders at the interactive rate. The other views are paused and only
+  re-rendered when a display, slice or camera they show was modified,
+  either at most idleRate times per second ('throttle') or once the
+  interaction in the focused view stopped ('onRelease'). In 'onRelease'
+  mode a modification made outside of any interaction is rendered at
+  the next turn of the event loop.
+  """
+  modes = ('throttle', 'onRelease')
+
+  # -------------------------------
+  def __init__(self, logic, idleRate = 2.0, interactiveRate = 30.0, mode = 'throttle'):
+    if mode not in self.modes:
+      raise ValueError('Unknown idle rendering mode: %s' % mode)
+    self.logic            = logic
+    self.idleRate         = idleRate
+    self.interactiveRate  = interactiveRate
+    self.mode             = mode
+    self.focusViewName    = None
+    self.interacting      = False
+    self.dirty            = set() # names of the idle views to render
+    self.focusCallbacks   = []    # callback(viewName), None when no view is focused
+    self.viewNames        = {}    # View Node ID -> View Name
+    self.observers        = []    # (vtkObject, observer tag)
+
+    # counters
+    self.renderRequests   = 0 # view modifications which would have triggered a render
+    self.rendersPerformed = 0 # renders of idle views
+    self.rendersSkipped   = 0 # idle views left alone by a flush because nothing changed
+
+    self.timer = qt.QTimer()
+    self.timer.connect('timeout()', self.flush)
+
+  # -------------------------------
+  def start(self):
+    scene          = slicer.mrmlScene
+    viewNames      = dict((viewID, viewName) for viewName, viewID in self.logic.viewMap.items())
+    self.viewNames = viewNames
+
+    for viewName, threeDView in self.logic.threeDViewMap.items():
+      threeDView.maximumUpdateRate = self.interactiveRate
+      threeDView.renderEnabled     = False
+      # the interactor reports the mouse entering and leaving the view,
+      # its style the start and the end of an interaction
+      interactor = threeDView.interactor()
+      style      = interactor.GetInteractorStyle()
+      for observed, event, callback in ((interactor, vtk.vtkCommand.EnterEvent, self.onEnter),
+                                        (interactor, vtk.vtkCommand.LeaveEvent, self.onLeave),
+                                        (style, vtk.vtkCommand.StartInteractionEvent, self.onStartInteraction),
+                                        (style, vtk.vtkCommand.EndInteractionEvent, self.onEndInteraction)):
+        if observed is None:
+          continue
+        tag = observed.AddObserver(event, lambda caller, e, name = viewName, callback = callback: callback(name))
+        self.observers.append((observed, tag))
+
+    for className in ('vtkMRMLDisplayNode', 'vtkMRMLSliceNode'):
+      collection = scene.GetNodesByClass(className)
+      for n in range(collection.GetNumberOfItems()):
+        node = collection.GetItemAsObject(n)
+        tag  = node.AddObserver(vtk.vtkCommand.ModifiedEvent, self.onNodeModified)
+        self.observers.append((node, tag))
+
+    cameraIndex = self.logic.getCameraIndex()
+    for viewID in viewNames:
+      cam = cameraIndex.cameraForView(viewID)
+      if cam is not None:
+        tag = cam.AddObserver(vtk.vtkCommand.ModifiedEvent, self.onNodeModified)
+        self.observers.append((cam, tag))
+
+    if self.mode == 'throttle':
+      self.timer.interval = int(1000.0 / self.idleRate)
+      self.timer.start()
+    else:
+      # flushed by onEndInteraction, or as soon as possible outside of an interaction
+      self.timer.singleShot = True
+      self.timer.interval   = 0
+
+  # -------------------------------
+  def setIdleRate(self, idleRate):
+    """change the rate of the idle views without restarting the scheduler"""
+    self.idleRate = idleRate
+    if self.mode == 'throttle':
+      self.timer.interval = int(1000.0 / idleRate)
+
+  # -------------------------------
+  def stop(self):
+    self.timer.stop()
+    for obj, tag in self.observers:
+      obj.RemoveObserver(tag)
+    self.observers = []
+    for threeDView in self.logic.threeDViewMap.values():
+      threeDView.renderEnabled = True
+      threeDView.scheduleRender()
+    self.dirty.clear()
+
+  # -------------------------------
+  def counters(self):
+    return {'requested' : self.renderRequests,
+            'performed' : self.rendersPerformed,
+            'avoided'   : self.renderRequests - self.rendersPerformed,
+            'skipped'   : self.rendersSkipped}
+
+  # -------------------------------
+  def _viewNamesOf(self, node):
+    """names of the views of the mosaic in which node is shown"""
+    if node.IsA('vtkMRMLCameraNode'):
+      viewIDs = [node.GetActiveTag()]
+    elif node.IsA('vtkMRMLSliceNode'):
+      viewIDs = [node.GetThreeDViewID(i) for i in range(node.GetNumberOfThreeDViewIDs())]
+    else:
+      viewIDs = [node.GetViewNodeID(i) for i in range(node.GetNumberOfViewNodeIDs())]
+      if not viewIDs:
+        # displayed in every view
+        viewIDs = self.viewNames.keys()
+    return [self.viewNames[viewID] for viewID in viewIDs if viewID in self.viewNames]
+
+  # -------------------------------
+  def onNodeModified(self, node, event):
+    for viewName in self._viewNamesOf(node):
+      if viewName != self.focusViewName:
+        self.renderRequests += 1
+        self.dirty.add(viewName)
+    if self.mode == 'onRelease' and self.dirty and not self.interacting and not self.timer.active:
+      self.timer.start()
+
+  # -------------------------------
+  def flush(self):
+    """render the idle views which changed since the last flush"""
+    if self.mode == 'onRelease' and self.interacting:
+      return
+    for viewName, threeDView in self.logic.threeDViewMap.items():
+      if viewName == self.focusViewName:
+        continue
+      if viewName not in self.dirty:
+        self.rendersSkipped += 1
+        continue
+      threeDView.renderEnabled = True
+      threeDView.forceRender()
+      threeDView.renderEnabled = False
+      self.rendersPerformed += 1
+    self.dirty.clear()
+
+  # -------------------------------
+  def _setFocus(self, viewName):
+    if viewName == self.focusViewName:
+      return
+    if self.focusViewName in self.logic.threeDViewMap:
+      self.logic.threeDViewMap[self.focusViewName].renderEnabled = False
+    self.focusViewName = viewName
+    if viewName in self.logic.threeDViewMap:
+      threeDView = self.logic.threeDViewMap[viewName]
+      threeDView.renderEnabled = True
+      if viewName in self.dirty:
+        self.dirty.discard(viewName)
+        threeDView.scheduleRender()
+    for callback in list(self.focusCallbacks):
+      callback(viewName)
+
+  # -------------------------------
+  def onEnter(self, viewName):
+    self._setFocus(viewName)
+
+  # -------------------------------
+  def onLeave(self, viewName):
+    # keep rendering the view while it is being dragged outside of it
+    if viewName == self.focusViewName and not self.interacting:
+      self._setFocus(None)
+
+  # -------------------------------
+  def onStartInteraction(self, viewName):
+    self.interacting = True
+
+  # -------------------------------
+  def onEndInteraction(self, viewName):
+    self.interacting = False
+    if self.mode == 'onRelease':
+      self.flush()
+
+# ============================================================
+#
+# MosaicSlicePlanePool
+#
+class MosaicSlicePlanePool:
+  """
+  One reslice pipeline per distinct slice position of the scene views.
+  A position is keyed by the slice-to-RAS matrix, the field of view, the
+  dimensions and the layers of the slice. A position matching a slice node
+  of the scene reuses it; any other position gets its own slice logic. The
+  texture of each plane is then shared by every 3D view showing it.
+  """
+  # -------------------------------
+  def __init__(self, scene = None):
+    self.scene       = scene if scene is not None else slicer.mrmlScene
+    self.planes      = {} # position key -> Slice Node in the scene
+    self.sceneKeys   = {} # Slice Node ID -> position key, cached until the node is modified
+    self.sliceLogics = [] # slice logics of the planes created by the pool
+    self.observers   = [] # (vtkObject, observer tag)
+
+  # -------------------------------
+  def cleanup(self):
+    for obj, tag in self.observers:
+      obj.RemoveObserver(tag)
+    self.observers = []
+    for sliceLogic in self.sliceLogics:
+      for node in (sliceLogic.GetSliceNode(), sliceLogic.GetSliceCompositeNode()):
+        if node is not None and self.scene.GetNodeByID(node.GetID()) is not None:
+          self.scene.RemoveNode(node)
+      sliceLogic.SetMRMLScene(None)
+    self.sliceLogics = []
+    self.planes      = {}
+    self.sceneKeys   = {}
+
+  # -------------------------------
+  def planeKey(self, sliceNode, compositeNode):
+    sliceToRAS = sliceNode.GetSliceToRAS()
+    matrix     = tuple([round(sliceToRAS.GetElement(i, j), 3) for i in range(4) for j in range(4)])
+    layers     = ()
+    if compositeNode is not None:
+      layers = (compositeNode.GetBackgroundVolumeID(), compositeNode.GetForegroundVolumeID(),
+                compositeNode.GetLabelVolumeID(), round(compositeNode.GetForegroundOpacity(), 3),
+                round(compositeNode.GetLabelOpacity(), 3))
+    return (matrix, tuple([round(f, 3) for f in sliceNode.GetFieldOfView()]),
+            tuple(sliceNode.GetDimensions()), layers)
+
+  # -------------------------------
+  def planeFor(self, svSliceNode, svCompositeNode):
+    """the slice node of the scene showing the position of a scene view slice node"""
+    key = self.planeKey(svSliceNode, svCompositeNode)
+    if key in self.planes:
+      return self.planes[key]
+
+    sceneSliceNode = None
+    if svSliceNode.GetID() is not None:
+      sceneSliceNode = self.scene.GetNodeByID(svSliceNode.GetID())
+    if sceneSliceNode is not None and self._sceneKey(sceneSliceNode) == key:
+      plane = sceneSliceNode
+    else:
+      plane = self._createPlane(svSliceNode, svCompositeNode)
+    self.planes[key] = plane
+    return plane
+
+  # -------------------------------
+  def describePlane(self, sliceNode):
+    """
+    Position of a plane created by the pool, None for a slice node of the
+    scene. planeFromDescription rebuilds the plane once the pool is gone.
+    """
+    for sliceLogic in self.sliceLogics:
+      if sliceLogic.GetSliceNode().GetID() == sliceNode.GetID():
+        compositeNode = sliceLogic.GetSliceCompositeNode()
+        break
+    else:
+      return None
+    sliceToRAS  = sliceNode.GetSliceToRAS()
+    description = {'sliceToRAS'  : [sliceToRAS.GetElement(i, j) for i in range(4) for j in range(4)],
+                   'fieldOfView' : list(sliceNode.GetFieldOfView()),
+                   'dimensions'  : list(sliceNode.GetDimensions())}
+    if compositeNode is not None:
+      description['layers'] = {'background'        : compositeNode.GetBackgroundVolumeID(),
+                               'foreground'        : compositeNode.GetForegroundVolumeID(),
+                               'label'             : compositeNode.GetLabelVolumeID(),
+                               'foregroundOpacity' : compositeNode.GetForegroundOpacity(),
+                               'labelOpacity'      : compositeNode.GetLabelOpacity()}
+    return description
+
+  # -------------------------------
+  def planeFromDescription(self, description):
+    """the slice node showing a position saved by describePlane"""
+    sliceNode  = slicer.vtkMRMLSliceNode()
+    sliceToRAS = sliceNode.GetSliceToRAS()
+    for index, value in enumerate(description['sliceToRAS']):
+      sliceToRAS.SetElement(index / 4, index % 4, value)
+    sliceNode.SetFieldOfView(*description['fieldOfView'])
+    sliceNode.SetDimensions(*description['dimensions'])
+
+    compositeNode = None
+    if 'layers' in description:
+      layers        = description['layers']
+      compositeNode = slicer.vtkMRMLSliceCompositeNode()
+      compositeNode.SetBackgroundVolumeID(layers['background'])
+      compositeNode.SetForegroundVolumeID(layers['foreground'])
+      compositeNode.SetLabelVolumeID(layers['label'])
+      compositeNode.SetForegroundOpacity(layers['foregroundOpacity'])
+      compositeNode.SetLabelOpacity(layers['labelOpacity'])
+    return self.planeFor(sliceNode, compositeNode)
+
+  # -------------------------------
+  def _sceneKey(self, sliceNode):
+    sliceNodeID = sliceNode.GetID()
+    if sliceNodeID not in self.sceneKeys:
+      compositeNode = None
+      compositeCollection = self.scene.GetNodesByClass('vtkMRMLSliceCompositeNode')
+      for c in range(compositeCollection.GetNumberOfItems()):
+        composite = compositeCollection.GetItemAsObject(c)
+        if composite.GetLayoutName() == sliceNode.GetLayoutName():
+          compositeNode = composite
+          break
+      self.sceneKeys[sliceNodeID] = self.planeKey(sliceNode, compositeNode)
+      for node in (sliceNode, compositeNode):
+        if node is not None:
+          tag = node.AddObserver(vtk.vtkCommand.ModifiedEvent,
+                                 lambda caller, event, sliceNode = sliceNode, compositeNode = compositeNode:
+                                   self._invalidate(sliceNode, compositeNode))
+          self.observers.append((node, tag))
+    return self.sceneKeys[sliceNodeID]
+
+  # -------------------------------
+  def _createPlane(self, svSliceNode, svCompositeNode):
+    # skip the layout names still used in the scene, e.g. by a pool of a previous module instance
+    usedNames       = set()
+    sliceCollection = self.scene.GetNodesByClass('vtkMRMLSliceNode')
+    for n in range(sliceCollection.GetNumberOfItems()):
+      usedNames.add(sliceCollection.GetItemAsObject(n).GetLayoutName())
+    index = len(self.sliceLogics) + 1
+    while 'Mosaic%d' % index in usedNames:
+      index += 1
+    layoutName = 'Mosaic%d' % index
+    sliceLogic = slicer.vtkMRMLSliceLogic()
+    sliceLogic.SetMRMLScene(self.scene)
+    sliceNode  = sliceLogic.AddSliceNode(layoutName)
+    self.sliceLogics.append(sliceLogic)
+
+    wasModifying = sliceNode.StartModify()
+    sliceNode.GetSliceToRAS().DeepCopy(svSliceNode.GetSliceToRAS())
+    sliceNode.SetFieldOfView(*svSliceNode.GetFieldOfView())
+    sliceNode.SetDimensions(*svSliceNode.GetDimensions())
+    sliceNode.UpdateMatrices()
+    sliceNode.EndModify(wasModifying)
+
+    compositeNode = sliceLogic.GetSliceCompositeNode()
+    if svCompositeNode is not None and compositeNode is not None:
+      compositeNode.SetBackgroundVolumeID(svCompositeNode.GetBackgroundVolumeID())
+      compositeNode.SetForegroundVolumeID(svCompositeNode.GetForegroundVolumeID())
+      compositeNode.SetLabelVolumeID(svCompositeNode.GetLabelVolumeID())
+      compositeNode.SetForegroundOpacity(svCompositeNode.GetForegroundOpacity())
+      compositeNode.SetLabelOpacity(svCompositeNode.GetLabelOpacity())
+
+    for node in (sliceNode, compositeNode):
+      if node is not None:
+        tag = node.AddObserver(vtk.vtkCommand.ModifiedEvent,
+                               lambda caller, event: self._invalidate(sliceNode, compositeNode))
+        self.observers.append((node, tag))
+    return sliceNode
+
+  # -------------------------------
+  def _invalidate(self, sliceNode, compositeNode):
+    """
+    Drop the cached positions a plane no longer shows. Modifications which
+    keep the position, e.g. adding a 3D view to the slice node, keep the cache.
+    """
+    key = self.planeKey(sliceNode, compositeNode)
+    if sliceNode.GetID() in self.sceneKeys:
+      self.sceneKeys[sliceNode.GetID()] = key
+    for planeKey, plane in self.planes.items():
+      if plane is sliceNode and planeKey != key:
+        del self.planes[planeKey]
+
+# ============================================================
+#
+# MosaicFiberCache
+#
+class MosaicFiberCache:
+  """
+  Subsampled copies of tractography bundles cached per bundle and fiber
+  budget. A copy keeps every n-th streamline and shares the points and
+  point data of the bundle, so it costs little more than its lines.
+  """
+  minBudget = 64   # never show fewer streamlines than this
+  minLines  = 50   # line-only models with fewer polylines are not treated as tractography
+
+  # -------------------------------
+  def __init__(self):
+    self.polyData = {} # (Bundle Node ID, budget) -> (bundle poly data MTime, subsampled poly data)
+
+  # -------------------------------
+  def isTractography(self, node):
+    if node.IsA('vtkMRMLFiberBundleNode'):
+      return True
+    if not node.IsA('vtkMRMLModelNode') or node.GetPolyData() is None:
+      return False
+    polyData = node.GetPolyData()
+    return polyData.GetNumberOfPolys() == 0 and polyData.GetNumberOfLines() >= self.minLines
+
+  # -------------------------------
+  def subsample(self, node, budget):
+    """poly data of node with at most budget streamlines"""
+    import math
+    polyData = node.GetPolyData()
+    key      = (node.GetID(), budget)
+    if key in self.polyData and self.polyData[key][0] == polyData.GetMTime():
+      return self.polyData[key][1]
+
+    step        = max(1, int(math.ceil(polyData.GetNumberOfLines() / float(budget))))
+    lines       = polyData.GetLines()
+    subsampled  = vtk.vtkCellArray()
+    idList      = vtk.vtkIdList()
+    lines.InitTraversal()
+    lineIndex   = 0
+    while lines.GetNextCell(idList):
+      if lineIndex % step == 0:
+        subsampled.InsertNextCell(idList)
+      lineIndex += 1
+
+    result = vtk.vtkPolyData()
+    result.SetPoints(polyData.GetPoints())
+    result.GetPointData().ShallowCopy(polyData.GetPointData())
+    result.SetLines(subsampled)
+    self.polyData[key] = (polyData.GetMTime(), result)
+    return result
+
+  # -------------------------------
+  def clear(self):
+    self.polyData = {}
+
+# ============================================================
+#
+# MosaicVisibilityMatrix
+#
+class MosaicVisibilityMatrix:
+  """
+  Dense (scene views x display nodes) visibility matrix of the mosaic.
+  Row i is the scene view shown in the view viewNames[i], column j the
+  display node displayIDs[j]. A display node which is not saved in a
+  scene view is unknown for that row and left untouched by apply.
+  """
+  # -------------------------------
+  def __init__(self, viewNames, displayIDs, visible, known, structureNames = None):
+    self.viewNames      = list(viewNames)
+    self.displayIDs     = list(displayIDs)
+    self.visible        = visible # numpy bool array (nViews, nDisplays)
+    self.known          = known   # numpy bool array (nViews, nDisplays)
+    self.structureNames = list(structureNames) if structureNames is not None else [None] * len(self.displayIDs)
+    self.rowIndex       = dict((name, i) for i, name in enumerate(self.viewNames))
+    self.columnIndex    = dict((displayID, j) for j, displayID in enumerate(self.displayIDs))
+
+  # -------------------------------
+  @classmethod
+  def fromSceneViews(cls, sceneViewNodes, viewNames, scene = None):
+    """
+    Read the display visibility saved in each scene view. viewNames[i] is
+    the view showing sceneViewNodes[i].
+    """
+    import numpy
+
+    rows, displayIDs, visibility = [], [], []
+    for row, sceneViewNode in enumerate(sceneViewNodes):
+      displayCollection = sceneViewNode.GetNodesByClass('vtkMRMLDisplayNode')
+      for d in range(displayCollection.GetNumberOfItems()):
+        displayNode = displayCollection.GetItemAsObject(d)
+        rows.append(row)
+        displayIDs.append(displayNode.GetID())
+        visibility.append(bool(displayNode.GetVisibility()))
+
+    columnIDs   = sorted(set(displayIDs))
+    columnIndex = dict((displayID, j) for j, displayID in enumerate(columnIDs))
+    columns     = numpy.array([columnIndex[displayID] for displayID in displayIDs], dtype = int)
+    shape       = (len(sceneViewNodes), len(columnIDs))
+    visible     = numpy.zeros(shape, dtype = bool)
+    known       = numpy.zeros(shape, dtype = bool)
+    rows        = numpy.array(rows, dtype = int)
+    visible[rows, columns] = visibility
+    known[rows, columns]   = True
+
+    structureNames = None
+    if scene is not None:
+      structureNames = [cls._structureName(scene, displayID) for displayID in columnIDs]
+    return cls(viewNames, columnIDs, visible, known, structureNames)
+
+  # -------------------------------
+  @staticmethod
+  def _structureName(scene, displayID):
+    displayNode = scene.GetNodeByID(displayID)
+    if displayNode is None or displayNode.GetDisplayableNode() is None:
+      return None
+    return displayNode.GetDisplayableNode().GetName()
+
+  # -------------------------------
+  def current(self, scene, viewMap):
+    """
+    The matrix currently shown in the scene, viewMap maps view names to view
+    node IDs. A display node with an empty view list is shown in every view.
+    """
+    import numpy
+
+    visible = numpy.zeros(self.visible.shape, dtype = bool)
+    rowOfViewID = dict((viewMap[name], i) for i, name in enumerate(self.viewNames) if name in viewMap)
+    for j, displayID in enumerate(self.displayIDs):
+      displayNode = scene.GetNodeByID(displayID)
+      if displayNode is None or not displayNode.GetVisibility():
+        continue
+      if displayNode.GetNumberOfViewNodeIDs() == 0:
+        visible[list(rowOfViewID.values()), j] = True
+        continue
+      for v in range(displayNode.GetNumberOfViewNodeIDs()):
+        row = rowOfViewID.get(displayNode.GetViewNodeID(v))
+        if row is not None:
+          visible[row, j] = True
+    return visible
+
+  # -------------------------------
+  def diff(self, currentVisible):
+    """(rows, columns) of the known entries which differ from currentVisible"""
+    import numpy
+    return numpy.nonzero(self.known & (self.visible != currentVisible))
+
+  # -------------------------------
+  def apply(self, scene, viewMap):
+    """
+    Update the display nodes having entries which differ from the scene in
+    one pass, with a single modified event per display node. Returns the
+    number of entries changed.
+    """
+    import numpy
+
+    currentVisible = self.current(scene, viewMap)
+    rows, columns  = self.diff(currentVisible)
+    # what each view shows afterwards: the scene view where known, the scene elsewhere
+    finalVisible   = numpy.where(self.known, self.visible, currentVisible)
+
+    for j in numpy.unique(columns):
+      displayNode = scene.GetNodeByID(self.displayIDs[j])
+      if displayNode is None:
+        continue
+      wasModifying = displayNode.StartModify()
+      if not finalVisible[:, j].any():
+        # hidden in the whole mosaic: emptying the view list would show it everywhere
+        displayNode.SetVisibility(0)
+      else:
+        # an empty list shows the node everywhere, listing the views restricts it to them
+        everywhere = displayNode.GetNumberOfViewNodeIDs() == 0
+        for i, viewName in enumerate(self.viewNames):
+          viewID = viewMap.get(viewName)
+          if viewID is None:
+            continue
+          if finalVisible[i, j]:
+            displayNode.AddViewNodeID(viewID)
+          elif not everywhere:
+            displayNode.RemoveViewNodeID(viewID)
+        displayNode.SetVisibility(1)
+      displayNode.EndModify(wasModifying)
+    return len(rows)
+
+  # -------------------------------
+  def displaysIn(self, viewName):
+    """IDs of the display nodes visible in a view"""
+    row = self.rowIndex[viewName]
+    return [self.displayIDs[j] for j in self.visible[row].nonzero()[0]]
+
+  # -------------------------------
+  def structuresIn(self, viewName):
+    """names of the models, volumes... visible in a view"""
+    row   = self.rowIndex[viewName]
+    names = [self.structureNames[j] for j in self.visible[row].nonzero()[0]]
+    return sorted(set([name for name in names if name is not None]))
+
+  # -------------------------------
+  def viewsShowing(self, structure):
+    """names of the views showing a display node ID or any display of a structure name"""
+    columns = [j for j, (displayID, name) in enumerate(zip(self.displayIDs, self.structureNames))
+               if structure in (displayID, name)]
+    if not columns:
+      return []
+    return [self.viewNames[i] for i in self.visible[:, columns].any(axis = 1).nonzero()[0]]
 
 # ============================================================
 #
 # MosaicViewerLogic
 #
 class MosaicViewerLogic:
+  # camera properties copied by syncCam in each mode
+  syncModes = ('all', 'rotation', 'zoom')
+
   # -------------------------------
   def __init__(self):
     self.threeDViewPattern = """
@@ -320,6 +1265,33 @@ class MosaicViewerLogic:
     # use a nice set of colors
     self.colors = slicer.util.getNode('GenericColors')
     self.lookupTable = self.colors.GetLookupTable()
+
+    # the mosaic built by the last renderAllSceneViewNodes
+    self.layoutDescription = None
+    self.layoutGrid        = [] # View Names, row by row
+    self.sceneviewNames    = []
+    self.viewMap           = {} # View Node <Name, ID>
+    self.threeDViewMap     = {} # ThreeDView <Name, View>
+    self.viewSceneViews    = {} # View Name -> Scene View Name
+    self.visibleDisplayIDs = {} # View Name -> [Display Node ID]
+    self.visibleSliceIDs   = {} # View Name -> [Slice Node ID]
+    self.visibilityMatrix  = None # MosaicVisibilityMatrix of the scene views
+
+    # camera synchronisation
+    self.cameraIndex       = None # built on first use, see getCameraIndex
+    self.syncGroups        = {}   # group name -> [View Node ID]
+
+    self.renderScheduler   = None
+    self.slicePlanePool    = None
+    self.offscreenTiles    = {} # View Name -> off-screen vtkRenderWindow, see captureMosaic
+
+    # tractography
+    self.fiberCache         = MosaicFiberCache()
+    self.fibersPerMegapixel = 20000 # streamlines shown per million pixels of a view
+    self.fiberProxies       = {}    # (Bundle Node ID, budget) -> subsampled Model Node
+    self.fiberTiles         = {}    # View Name -> [(Bundle Display Node, Proxy Model Node)]
+    self.focusedFiberTile   = None
+    self.fiberObservers     = []    # (interactor, observer tag) focusing the tiles
   
   # ----------------------------------  
   def updateNViewNode(self):
@@ -335,6 +1307,58 @@ class MosaicViewerLogic:
     else:
       layoutNode.AddLayoutDescription(layoutNode.SlicerLayoutUserView, layoutDescription)
     layoutNode.SetViewArrangement(layoutNode.SlicerLayoutUserView)
+    self.layoutDescription = layoutDescription
+
+  # ----------------------------------
+  def mosaicSnapshot(self):
+    """
+    Describe the current mosaic so that it can be carried over a module
+    reload without rebuilding the views
+    """
+    return {'layoutDescription' : self.layoutDescription,
+            'layoutGrid'        : [list(row) for row in self.layoutGrid],
+            'sceneviewNames'    : list(self.sceneviewNames),
+            'viewMap'           : dict(self.viewMap),
+            'threeDViewMap'     : dict(self.threeDViewMap),
+            'viewSceneViews'    : dict(self.viewSceneViews),
+            'visibleDisplayIDs' : dict(self.visibleDisplayIDs),
+            'visibleSliceIDs'   : dict(self.visibleSliceIDs),
+            'visibilityMatrix'  : self.visibilityMatrix,
+            'syncGroups'        : dict((name, list(viewIDs)) for name, viewIDs in self.syncGroups.items()),
+            'slicePlanePool'    : self.slicePlanePool,
+            'fiberProxies'      : dict(self.fiberProxies),
+            'fiberTiles'        : dict((viewName, list(tiles)) for viewName, tiles in self.fiberTiles.items()),
+            'focusedFiberTile'  : self.focusedFiberTile}
+
+  # ----------------------------------
+  def restoreMosaicSnapshot(self, snapshot):
+    """
+    Adopt a mosaic described by mosaicSnapshot, dropping the views which
+    have been removed from the scene in the meantime
+    """
+    scene = slicer.mrmlScene
+    self.layoutDescription = snapshot['layoutDescription']
+    self.layoutGrid        = [list(row) for row in snapshot.get('layoutGrid', [])]
+    self.sceneviewNames    = list(snapshot['sceneviewNames'])
+    self.viewMap           = {}
+    self.threeDViewMap     = {}
+    for viewName, viewID in snapshot['viewMap'].items():
+      if scene.GetNodeByID(viewID) is None:
+        continue
+      self.viewMap[viewName] = viewID
+      if viewName in snapshot['threeDViewMap']:
+        self.threeDViewMap[viewName] = snapshot['threeDViewMap'][viewName]
+    self.viewSceneViews    = dict(snapshot.get('viewSceneViews', {}))
+    self.visibleDisplayIDs = dict(snapshot.get('visibleDisplayIDs', {}))
+    self.visibleSliceIDs   = dict(snapshot.get('visibleSliceIDs', {}))
+    self.visibilityMatrix  = snapshot.get('visibilityMatrix')
+    self.syncGroups        = dict((name, [viewID for viewID in viewIDs if scene.GetNodeByID(viewID) is not None])
+                                  for name, viewIDs in snapshot.get('syncGroups', {}).items())
+    self.slicePlanePool    = snapshot.get('slicePlanePool')
+    self.fiberProxies      = dict(snapshot.get('fiberProxies', {}))
+    self.fiberTiles        = dict((viewName, list(tiles)) for viewName, tiles in snapshot.get('fiberTiles', {}).items())
+    self.focusedFiberTile  = snapshot.get('focusedFiberTile')
+    self._observeFiberFocus()
 
   # ------------------------------------
   def makeLayout(self, nNodes, sceneviewNames, nRows = 1, nColumns = 1):
@@ -357,11 +1381,13 @@ class MosaicViewerLogic:
     # - default orientation as specified
     #
     actualsceneviewNames = []
+    layoutGrid = [] # view node names, row by row
     index = 1
     layoutDescription = ''
     layoutDescription += '<layout type="vertical">\n'
     for row in range(int(nRows)):
       layoutDescription += ' <item> <layout type="horizontal">\n'
+      layoutGrid.append([])
       for column in range(int(nColumns)):
         try:
           viewName = sceneviewNames[index - 1]
@@ -370,10 +1396,12 @@ class MosaicViewerLogic:
           # viewName = 'null'
         layoutDescription += self.threeDViewPattern.format(viewName = viewName)
         actualsceneviewNames.append(viewName)
+        layoutGrid[-1].append('View' + viewName)
         index += 1
       layoutDescription += '</layout></item>\n'
     layoutDescription += '</layout>'
     self.assignLayoutDescription(layoutDescription)
+    self.layoutGrid = layoutGrid
 
     return actualsceneviewNames
 
@@ -489,6 +1517,13 @@ class MosaicViewerLogic:
 
       print '*************** Start loadisng the scene views ***************'
 
+      # the views of the previous mosaic are about to be removed
+      self.stopRenderScheduler()
+      if self.slicePlanePool is not None:
+        self.slicePlanePool.cleanup()
+        self.slicePlanePool = None
+      self.removeFiberBudgets()
+
       print '------------------------------------------'
       if state is not None:
         print state.layoutMethod, 'Layout: ', state.nRows, ' * ', state.nColumns
@@ -526,6 +1561,7 @@ class MosaicViewerLogic:
       # Scene view names, sorted in alphabetical order
       sceneviewNames = [n.GetName() for n in svNodes]
       sceneviewNames.sort()
+      self.sceneviewNames = sceneviewNames
 
       # extract the camera nodes and add to the scene, must be done before making layout
       # cameraNodeCollection              = self._getCamera(svNodes, nodesdisct, sceneviewNames)
@@ -536,20 +1572,14 @@ class MosaicViewerLogic:
       else:
         self.makeLayout(len(svNodes), sceneviewNames, state.nRows, state.nColumns)
 
-      layoutManager                     = slicer.app.layoutManager()
-      nview                             = layoutManager.threeDViewCount 
-      threeDViewMap                     = {} # ThreeDView <ID, Node>
-      viewMap                           = {} # View Node <Name, ID>
-
       sceneCameraNodeCollection         = scene.GetNodesByClass('vtkMRMLCameraNode')
 
-      for v in range(nview):
-        threeDWidget                    = layoutManager.threeDWidget(v)
-        threeDView                      = threeDWidget.threeDView() 
-        viewNode                        = threeDView.mrmlViewNode()
-        scene.AddNode(viewNode)
-        viewMap[viewNode.GetName()]     = viewNode.GetID()   
-        threeDViewMap[viewNode.GetName()] = threeDView   
+      viewMap, threeDViewMap            = self._collectMosaicViews()
+      if state is not None and state.shareSlicePlanes:
+        self.slicePlanePool             = MosaicSlicePlanePool(scene)
+      self.viewSceneViews               = {}
+      self.visibleDisplayIDs            = {}
+      self.visibleSliceIDs              = {}
 
       # iterate all loaded scene view nodes
       for s in range(len(svNodes)):
@@ -561,6 +1591,8 @@ class MosaicViewerLogic:
         viewName              = 'View' + cSceneView.GetName()
         viewID                = viewMap[viewName]
         threeDView            = threeDViewMap[viewName]
+        self.viewSceneViews[viewName]    = cSceneView.GetName()
+        self.visibleSliceIDs[viewName]   = []
         
         # add nodes in sceneview to scene
         print '-------------------------------------------'
@@ -578,28 +1610,27 @@ class MosaicViewerLogic:
             #print ' = Existing node: ', sv_nodei.GetID()
             pass
 
-        # find the dissplay models are in this scene view
-        sceneviewdissplayCollection    = cSceneView.GetNodesByClass('vtkMRMLdissplayNode')
-        nSceneviewdissplay             = sceneviewdissplayCollection.GetNumberOfItems()
-
-        for d in range(nSceneviewdissplay):
-          dis   = sceneviewdissplayCollection.GetItemAsObject(d)
-          disInScene = scene.GetNodeByID(dis.GetID())
-          if dis.GetVisibility():
-            disInScene.AddViewNodeID(viewID)
-            disInScene.SetVisibility(1)
-          else:
-            disInScene.RemoveViewNodeID(viewID)
-
         # find the 2D slices in the scene view
         sceneview_slice_collection      = cSceneView.GetNodesByClass('vtkMRMLSliceNode')
         n_sceneview_slice               = sceneview_slice_collection.GetNumberOfItems()
+        sceneview_composite_collection  = cSceneView.GetNodesByClass('vtkMRMLSliceCompositeNode')
+        sceneviewComposites             = {} # Layout Name -> Slice Composite Node
+        for c in range(sceneview_composite_collection.GetNumberOfItems()):
+          compositei                    = sceneview_composite_collection.GetItemAsObject(c)
+          sceneviewComposites[compositei.GetLayoutName()] = compositei
         for d in range(n_sceneview_slice):
           slicei                        = sceneview_slice_collection.GetItemAsObject(d)
           s_slicei                      = scene.GetNodeByID(slicei.GetID())
           if slicei.GetSliceVisible():
+            if self.slicePlanePool is not None:
+              # show the plane resliced at the position of this scene view
+              plane = self.slicePlanePool.planeFor(slicei, sceneviewComposites.get(slicei.GetLayoutName()))
+              if plane is not s_slicei:
+                s_slicei.RemoveThreeDViewID(viewID)
+              s_slicei = plane
             s_slicei.AddThreeDViewID(viewID)
             s_slicei.SetSliceVisible(1)
+            self.visibleSliceIDs[viewName].append(s_slicei.GetID())
           else:
             print ' * Missing node : ', slicei.GetID()
             s_slicei.RemoveThreeDViewID(viewID)
@@ -627,14 +1658,8 @@ class MosaicViewerLogic:
           raise Exception('No camera to restore for sceneview:' + cSceneView.GetName() )
 
         # Find the camera node of the current viewNode to apply 
-        scam2restore = None
         viewNode = threeDView.mrmlViewNode()
-        for c in range(sceneCameraNodeCollection.GetNumberOfItems()):
-          cam = sceneCameraNodeCollection.GetItemAsObject(c)
-          if cam.GetActiveTag() == viewNode.GetID():
-            print ' Found the camera node in scene: ', viewNode.GetName(), ' - ', cam.GetID()
-            scam2restore = cam
-            break
+        scam2restore = self.getCameraIndex().cameraForView(viewNode)
 
         if scam2restore == None:
           raise Exception('No camera to restore for view:' + viewNode.GetName() )
@@ -644,6 +1669,21 @@ class MosaicViewerLogic:
         scam2restore.UpdateScene(scene)
         print ' Restore camera position: ', sceneviewCameraNode.GetCamera().GetPosition()
        
+      # resolve which display shows in which view for all scene views at once
+      # and only apply the entries which differ from the scene
+      svViewNames               = ['View' + name for name in sceneviewNames]
+      self.visibilityMatrix     = MosaicVisibilityMatrix.fromSceneViews(
+                                    [nodesdisct[name] for name in sceneviewNames], svViewNames, scene)
+      nChanged                  = self.visibilityMatrix.apply(scene, viewMap)
+      print ' Display visibility entries changed: ', nChanged
+      for viewName in svViewNames:
+        self.visibleDisplayIDs[viewName] = self.visibilityMatrix.displaysIn(viewName)
+
+      if state is not None and state.subsampleFibers:
+        # let the layout give the views their final size first
+        slicer.app.processEvents()
+        self.applyFiberBudgets()
+
       print '*********** Finish loadisng all scene views *************'
 
       print 'DEBUG:'
@@ -651,35 +1691,702 @@ class MosaicViewerLogic:
         cam = sceneCameraNodeCollection.GetItemAsObject(c)
         print cam.GetActiveTag()
 
-  def syncCam(self, viewNode):
-    # This function will retrieve the camera node of the specific ViewNode to all the ViewNodes
+  # ------------------------------------------
+  def _collectMosaicViews(self):
+    """map the 3D views created by the current layout by their name"""
+    scene                               = slicer.mrmlScene
+    layoutManager                       = slicer.app.layoutManager()
+    threeDViewMap                       = {} # ThreeDView <Name, View>
+    viewMap                             = {} # View Node <Name, ID>
+    for v in range(layoutManager.threeDViewCount):
+      threeDView                        = layoutManager.threeDWidget(v).threeDView()
+      viewNode                          = threeDView.mrmlViewNode()
+      scene.AddNode(viewNode)
+      viewMap[viewNode.GetName()]       = viewNode.GetID()
+      threeDViewMap[viewNode.GetName()] = threeDView
+    self.viewMap                        = viewMap
+    self.threeDViewMap                  = threeDViewMap
+    return viewMap, threeDViewMap
+
+  # ------------------------------------------
+  def exportSession(self, fileName):
+    """
+    Save the mosaic resolved by renderAllSceneViewNodes: the layout, the
+    scene view shown in each view, the displays and slices it shows and
+    hides, the position of its shared slice planes and its camera.
+    loadSession reopens it without scanning the scene views.
+    """
+    import json
+
+    if not self.viewSceneViews:
+      raise Exception('No mosaic to export, apply the mosaic viewer first')
+
+    scene           = slicer.mrmlScene
+    cameraIndex     = self.getCameraIndex()
+    displays        = self._resolvedDisplays()
+    sliceCollection = scene.GetNodesByClass('vtkMRMLSliceNode')
+    sceneSliceIDs   = [sliceCollection.GetItemAsObject(n).GetID() for n in range(sliceCollection.GetNumberOfItems())]
+    views           = []
+    for viewName in sorted(self.viewSceneViews.keys()):
+      displayIDs, hiddenDisplayIDs = displays.get(viewName, ([], []))
+      sliceIDs = self.visibleSliceIDs.get(viewName, [])
+      view = {'name'             : viewName,
+              'sceneView'        : self.viewSceneViews[viewName],
+              'displayIDs'       : displayIDs,
+              'hiddenDisplayIDs' : hiddenDisplayIDs,
+              'sliceIDs'         : sliceIDs,
+              'hiddenSliceIDs'   : [sliceID for sliceID in sceneSliceIDs if sliceID not in sliceIDs],
+              'planes'           : {}}
+      # the shared planes only live as long as the pool, save their position instead
+      if self.slicePlanePool is not None:
+        for sliceID in sliceIDs:
+          description = self.slicePlanePool.describePlane(scene.GetNodeByID(sliceID))
+          if description is not None:
+            view['planes'][sliceID] = description
+      cam = cameraIndex.cameraForView(self.viewMap[viewName])
+      if cam is not None:
+        view['camera'] = {'position'           : list(cam.GetPosition()),
+                          'focalPoint'         : list(cam.GetFocalPoint()),
+                          'viewUp'             : list(cam.GetViewUp()),
+                          'viewAngle'          : cam.GetViewAngle(),
+                          'parallelScale'      : cam.GetParallelScale(),
+                          'parallelProjection' : cam.GetParallelProjection()}
+      views.append(view)
+
+    session = {'version'           : 2,
+               'sceneURL'          : scene.GetURL(),
+               'layoutDescription' : self.layoutDescription,
+               'layoutGrid'        : self.layoutGrid,
+               'sceneviewNames'    : self.sceneviewNames,
+               'views'             : views}
+    f = open(fileName, 'w')
+    try:
+      json.dump(session, f, indent = 1)
+    finally:
+      f.close()
+
+  # ------------------------------------------
+  def _resolvedDisplays(self):
+    """
+    View Name -> (IDs of the displays the view shows, IDs of the displays it
+    hides), as the scene currently shows them. A subsampled tractography
+    counts as its full bundle.
+    """
+    if self.visibilityMatrix is None:
+      return dict((viewName, (list(displayIDs), [])) for viewName, displayIDs in self.visibleDisplayIDs.items())
+
+    matrix = self.visibilityMatrix
+    shown  = matrix.current(slicer.mrmlScene, self.viewMap)
+    for viewName, tiles in self.fiberTiles.items():
+      for displayNode, proxy in tiles:
+        if viewName in matrix.rowIndex and displayNode.GetID() in matrix.columnIndex:
+          shown[matrix.rowIndex[viewName], matrix.columnIndex[displayNode.GetID()]] = True
+
+    displays = {}
+    for viewName, row in matrix.rowIndex.items():
+      displays[viewName] = ([displayID for j, displayID in enumerate(matrix.displayIDs) if shown[row, j]],
+                            [displayID for j, displayID in enumerate(matrix.displayIDs) if not shown[row, j]])
+    return displays
+
+  # ------------------------------------------
+  def loadSession(self, fileName, loadScene = True):
+    """
+    Reopen a mosaic saved by exportSession. The scene it was built from is
+    loaded first unless it is already the current scene or loadScene is False.
+    """
+    import json, numpy
+
+    f = open(fileName, 'r')
+    try:
+      session = json.load(f)
+    finally:
+      f.close()
+
     scene = slicer.mrmlScene
-    sceneCameraCollection = scene.GetNodesByClass("vtkMRMLCameraNode")
-    ncam = sceneCameraCollection.GetNumberOfItems()
+    if loadScene and session['sceneURL'] and scene.GetURL() != session['sceneURL']:
+      slicer.util.loadScene(session['sceneURL'])
+
+    # the shared planes of the session replace those of the current mosaic
+    if self.slicePlanePool is not None:
+      self.slicePlanePool.cleanup()
+      self.slicePlanePool = None
+    sliceIDMap = {} # Slice Node ID in the session -> Slice Node ID of the rebuilt plane
+    for view in session['views']:
+      for sliceID, description in view.get('planes', {}).items():
+        if sliceID not in sliceIDMap:
+          if self.slicePlanePool is None:
+            self.slicePlanePool = MosaicSlicePlanePool(scene)
+          sliceIDMap[sliceID] = self.slicePlanePool.planeFromDescription(description).GetID()
+
+    self.assignLayoutDescription(session['layoutDescription'])
+    self.layoutGrid     = [list(row) for row in session.get('layoutGrid', [])]
+    self.sceneviewNames = list(session['sceneviewNames'])
+    viewMap, threeDViewMap = self._collectMosaicViews()
+
+    self.viewSceneViews    = {}
+    self.visibleDisplayIDs = {}
+    self.visibleSliceIDs   = {}
+    views                  = [] # the views of the session found in the layout
+    sliceViews             = {} # Slice Node ID -> [View Node ID], empty when hidden in every view
+    for view in session['views']:
+      viewName = view['name']
+      if viewName not in viewMap:
+        print ' * Missing view : ', viewName
+        continue
+      views.append(view)
+      self.viewSceneViews[viewName]    = view['sceneView']
+      self.visibleDisplayIDs[viewName] = list(view['displayIDs'])
+      self.visibleSliceIDs[viewName]   = [sliceIDMap.get(sliceID, sliceID) for sliceID in view['sliceIDs']]
+      for sliceID in self.visibleSliceIDs[viewName]:
+        sliceViews.setdefault(sliceID, []).append(viewMap[viewName])
+      for sliceID in view.get('hiddenSliceIDs', []):
+        sliceViews.setdefault(sliceIDMap.get(sliceID, sliceID), [])
+
+    # the displays shown and hidden in each view, applied like the scene views
+    displayIDs  = sorted(set([displayID for view in views
+                              for displayID in view['displayIDs'] + view.get('hiddenDisplayIDs', [])]))
+    columnIndex = dict((displayID, j) for j, displayID in enumerate(displayIDs))
+    visible     = numpy.zeros((len(views), len(displayIDs)), dtype = bool)
+    known       = numpy.zeros((len(views), len(displayIDs)), dtype = bool)
+    for i, view in enumerate(views):
+      for displayID in view['displayIDs']:
+        visible[i, columnIndex[displayID]] = True
+        known[i, columnIndex[displayID]]   = True
+      for displayID in view.get('hiddenDisplayIDs', []):
+        known[i, columnIndex[displayID]]   = True
+    structureNames        = [MosaicVisibilityMatrix._structureName(scene, displayID) for displayID in displayIDs]
+    self.visibilityMatrix = MosaicVisibilityMatrix([view['name'] for view in views], displayIDs,
+                                                   visible, known, structureNames)
+    nChanged              = self.visibilityMatrix.apply(scene, viewMap)
+    print ' Display visibility entries changed: ', nChanged
+
+    mosaicViewIDs = viewMap.values()
+    for sliceID, viewIDs in sliceViews.items():
+      sliceNode = scene.GetNodeByID(sliceID)
+      if sliceNode is None:
+        continue
+      if not viewIDs:
+        # an empty 3D view list would show the slice in every view
+        sliceNode.SetSliceVisible(0)
+        continue
+      for viewID in mosaicViewIDs:
+        if viewID in viewIDs:
+          sliceNode.AddThreeDViewID(viewID)
+        else:
+          sliceNode.RemoveThreeDViewID(viewID)
+      sliceNode.SetSliceVisible(1)
+
+    cameraIndex = self.getCameraIndex()
+    for view in views:
+      if 'camera' not in view:
+        continue
+      cam = cameraIndex.cameraForView(viewMap[view['name']])
+      if cam is None:
+        continue
+      camera       = view['camera']
+      wasModifying = cam.StartModify()
+      cam.SetFocalPoint(camera['focalPoint'])
+      cam.SetPosition(camera['position'])
+      cam.SetViewUp(camera['viewUp'])
+      if 'viewAngle' in camera:
+        cam.SetViewAngle(camera['viewAngle'])
+      cam.SetParallelScale(camera['parallelScale'])
+      cam.SetParallelProjection(camera['parallelProjection'])
+      cam.EndModify(wasModifying)
 
-    cam2apply = None 
-    
-    print 'DEBUG find CAMNODE ========='
-    # Get the node to be applied to all views
-    for i in range(ncam):
-      cam = sceneCameraCollection.GetItemAsObject(i)
-      print cam.GetActiveTag(), viewNode.GetID()
-      if cam.GetActiveTag() == viewNode.GetID():
-        cam2apply = cam 
-        break
+  # ------------------------------------------
+  def startRenderScheduler(self, idleRate = 2.0, mode = 'throttle'):
+    """throttle the rendering of the views of the mosaic, see MosaicRenderScheduler"""
+    self.stopRenderScheduler()
+    if not self.threeDViewMap:
+      return None
+    self.renderScheduler = MosaicRenderScheduler(self, idleRate = idleRate, mode = mode)
+    self.renderScheduler.start()
+    return self.renderScheduler
+
+  # ------------------------------------------
+  def fiberBudget(self, threeDView):
+    """number of streamlines for a view, rounded down to a power of two so that budgets are shared"""
+    import math
+    budget = self.fibersPerMegapixel * threeDView.width * threeDView.height / 1.0e6
+    return 2 ** int(math.log(max(budget, MosaicFiberCache.minBudget), 2))
+
+  # ------------------------------------------
+  def applyFiberBudgets(self):
+    """
+    Replace the tractography shown in each view of the mosaic by a copy
+    subsampled to the budget of the view. focusFiberTile restores the full
+    density in one view.
+    """
+    scene = slicer.mrmlScene
+    self.removeFiberBudgets()
+
+    for viewName, displayIDs in self.visibleDisplayIDs.items():
+      if viewName not in self.threeDViewMap:
+        continue
+      viewID = self.viewMap[viewName]
+      budget = self.fiberBudget(self.threeDViewMap[viewName])
+      for displayID in displayIDs:
+        displayNode = scene.GetNodeByID(displayID)
+        if displayNode is None:
+          continue
+        bundle = displayNode.GetDisplayableNode()
+        if bundle is None or not self.fiberCache.isTractography(bundle) \
+           or bundle.GetPolyData().GetNumberOfLines() <= budget:
+          continue
+        proxy = self._fiberProxy(bundle, displayNode, budget)
+        self._moveView(viewID, displayNode, proxy.GetDisplayNode())
+        self.fiberTiles.setdefault(viewName, []).append((displayNode, proxy))
+    self._observeFiberFocus()
+
+  # ------------------------------------------
+  def _observeFiberFocus(self):
+    """focus the tile under the mouse, whether or not the render scheduler runs"""
+    self._removeFiberFocusObservers()
+    for viewName in self.fiberTiles:
+      if viewName not in self.threeDViewMap:
+        continue
+      interactor = self.threeDViewMap[viewName].interactor()
+      for event, callback in ((vtk.vtkCommand.EnterEvent, self.onEnterFiberTile),
+                              (vtk.vtkCommand.LeaveEvent, self.onLeaveFiberTile)):
+        tag = interactor.AddObserver(event, lambda caller, e, name = viewName, callback = callback: callback(name))
+        self.fiberObservers.append((interactor, tag))
+
+  # ------------------------------------------
+  def _removeFiberFocusObservers(self):
+    for interactor, tag in self.fiberObservers:
+      interactor.RemoveObserver(tag)
+    self.fiberObservers = []
+
+  # ------------------------------------------
+  def onEnterFiberTile(self, viewName):
+    self.focusFiberTile(viewName)
+
+  # ------------------------------------------
+  def onLeaveFiberTile(self, viewName):
+    if viewName == self.focusedFiberTile:
+      self.focusFiberTile(None)
+
+  # ------------------------------------------
+  def removeFiberBudgets(self):
+    """show the full tractography again and remove the subsampled copies"""
+    self._removeFiberFocusObservers()
+    self.focusFiberTile(None)
+    for viewName, tiles in self.fiberTiles.items():
+      for displayNode, proxy in tiles:
+        self._moveView(self.viewMap.get(viewName), proxy.GetDisplayNode(), displayNode)
+    for proxy in self.fiberProxies.values():
+      if slicer.mrmlScene.GetNodeByID(proxy.GetID()) is not None:
+        slicer.mrmlScene.RemoveNode(proxy.GetDisplayNode())
+        slicer.mrmlScene.RemoveNode(proxy)
+    self.fiberTiles   = {}
+    self.fiberProxies = {}
+
+  # ------------------------------------------
+  def focusFiberTile(self, viewName):
+    """show the full density tractography in viewName only, None to unfocus"""
+    if viewName == self.focusedFiberTile:
+      return
+    if self.focusedFiberTile is not None:
+      for displayNode, proxy in self.fiberTiles.get(self.focusedFiberTile, []):
+        self._moveView(self.viewMap.get(self.focusedFiberTile), displayNode, proxy.GetDisplayNode())
+    self.focusedFiberTile = viewName
+    for displayNode, proxy in self.fiberTiles.get(viewName, []):
+      self._moveView(self.viewMap.get(viewName), proxy.GetDisplayNode(), displayNode)
+
+  # ------------------------------------------
+  def _fiberProxy(self, bundle, displayNode, budget):
+    key = (bundle.GetID(), budget)
+    if key not in self.fiberProxies:
+      scene        = slicer.mrmlScene
+      proxyDisplay = slicer.vtkMRMLModelDisplayNode()
+      proxyDisplay.SetColor(displayNode.GetColor())
+      proxyDisplay.SetOpacity(displayNode.GetOpacity())
+      proxyDisplay.SetScalarVisibility(displayNode.GetScalarVisibility())
+      proxyDisplay.SetActiveScalarName(displayNode.GetActiveScalarName())
+      proxyDisplay.SetScalarRange(displayNode.GetScalarRange())
+      proxyDisplay.SetAndObserveColorNodeID(displayNode.GetColorNodeID())
+      proxyDisplay.SetVisibility(0)
+      scene.AddNode(proxyDisplay)
+
+      proxy = slicer.vtkMRMLModelNode()
+      proxy.SetName(scene.GetUniqueNameByString('%s (%d fibers)' % (bundle.GetName(), budget)))
+      proxy.SetHideFromEditors(1)
+      proxy.SetAndObservePolyData(self.fiberCache.subsample(bundle, budget))
+      scene.AddNode(proxy)
+      proxy.SetAndObserveDisplayNodeID(proxyDisplay.GetID())
+      self.fiberProxies[key] = proxy
+    return self.fiberProxies[key]
 
-    print 'DEBUG end find CAMNODE======'
+  # ------------------------------------------
+  def _moveView(self, viewID, fromDisplay, toDisplay):
+    """
+    Move a view from the view list of a display to another one. A display
+    left without any view is hidden, since an empty list means every view.
+    """
+    if viewID is None:
+      return
+    if fromDisplay.GetNumberOfViewNodeIDs() == 0:
+      # shown everywhere so far, restrict it to the other views of the mosaic
+      for otherViewID in self.viewMap.values():
+        fromDisplay.AddViewNodeID(otherViewID)
+    fromDisplay.RemoveViewNodeID(viewID)
+    if fromDisplay.GetNumberOfViewNodeIDs() == 0:
+      fromDisplay.SetVisibility(0)
+    toDisplay.AddViewNodeID(viewID)
+    toDisplay.SetVisibility(1)
+
+  # ------------------------------------------
+  def orbitPath(self, nFrames, degrees = 360.0):
+    """camera path turning every view around its focal point, see exportAnimation"""
+    return lambda frame: (degrees * frame / nFrames, 0.0, 1.0)
+
+  # ------------------------------------------
+  def keyframePath(self, keyframes):
+    """
+    Camera path interpolating (frame, azimuth, elevation, dolly) keyframes,
+    sorted by frame, see exportAnimation
+    """
+    def path(frame):
+      if frame <= keyframes[0][0]:
+        return tuple(keyframes[0][1:])
+      for previous, following in zip(keyframes[:-1], keyframes[1:]):
+        if frame <= following[0]:
+          t = float(frame - previous[0]) / (following[0] - previous[0])
+          return tuple([a + t * (b - a) for a, b in zip(previous[1:], following[1:])])
+      return tuple(keyframes[-1][1:])
+    return path
+
+  # ------------------------------------------
+  def captureMosaic(self):
+    """
+    Render every view of the layout off-screen and assemble the images into
+    one image of the whole mosaic. The on-screen windows are not read, so
+    covered or minimised views are captured as well.
+    """
+    rows = vtk.vtkImageAppend()
+    rows.SetAppendAxis(1)
+    # the image origin is the bottom left corner: append the last row first
+    for row in reversed(self.layoutGrid):
+      columns = vtk.vtkImageAppend()
+      columns.SetAppendAxis(0)
+      for viewName in row:
+        if viewName not in self.threeDViewMap:
+          continue
+        capture = vtk.vtkWindowToImageFilter()
+        capture.SetInput(self._offscreenTile(viewName))
+        capture.ReadFrontBufferOff()
+        capture.ShouldRerenderOn()
+        capture.Update()
+        tile = vtk.vtkImageData()
+        tile.DeepCopy(capture.GetOutput())
+        _addInput(columns, tile)
+      if columns.GetNumberOfInputConnections(0) > 0:
+        columns.Update()
+        _addInput(rows, columns.GetOutput())
+    rows.Update()
+    image = vtk.vtkImageData()
+    image.DeepCopy(rows.GetOutput())
+    return image
+
+  # ------------------------------------------
+  def _offscreenTile(self, viewName):
+    """
+    Off-screen render window drawing the renderers of a view: same cameras,
+    backgrounds and props, at the size of the view
+    """
+    viewWindow = self.threeDViewMap[viewName].renderWindow()
+    if viewName not in self.offscreenTiles:
+      renderWindow = vtk.vtkRenderWindow()
+      renderWindow.SetOffScreenRendering(1)
+      self.offscreenTiles[viewName] = renderWindow
+    renderWindow = self.offscreenTiles[viewName]
+    renderWindow.SetSize(viewWindow.GetSize())
+    renderWindow.SetNumberOfLayers(viewWindow.GetNumberOfLayers())
+
+    # mirror the current renderers, the props of the view change between frames
+    renderers = renderWindow.GetRenderers()
+    for renderer in [renderers.GetItemAsObject(r) for r in range(renderers.GetNumberOfItems())]:
+      renderer.RemoveAllViewProps()
+      renderWindow.RemoveRenderer(renderer)
+    viewRenderers = viewWindow.GetRenderers()
+    for r in range(viewRenderers.GetNumberOfItems()):
+      viewRenderer = viewRenderers.GetItemAsObject(r)
+      renderer     = vtk.vtkRenderer()
+      renderer.SetLayer(viewRenderer.GetLayer())
+      renderer.SetViewport(viewRenderer.GetViewport())
+      renderer.SetBackground(viewRenderer.GetBackground())
+      renderer.SetBackground2(viewRenderer.GetBackground2())
+      renderer.SetGradientBackground(viewRenderer.GetGradientBackground())
+      renderer.SetActiveCamera(viewRenderer.GetActiveCamera())
+      props = viewRenderer.GetViewProps()
+      for p in range(props.GetNumberOfItems()):
+        renderer.AddViewProp(props.GetItemAsObject(p))
+      renderWindow.AddRenderer(renderer)
+    return renderWindow
+
+  # ------------------------------------------
+  def _releaseOffscreenTiles(self):
+    for renderWindow in self.offscreenTiles.values():
+      renderers = renderWindow.GetRenderers()
+      for r in range(renderers.GetNumberOfItems()):
+        renderers.GetItemAsObject(r).RemoveAllViewProps()
+      renderWindow.Finalize()
+    self.offscreenTiles = {}
+
+  # ------------------------------------------
+  def exportAnimation(self, fileName, nFrames = 72, path = None, frameRate = 24, queueSize = 8):
+    """
+    Move the cameras of every view along path in lockstep and write each
+    frame of the mosaic to fileName. path(frame) returns the (azimuth,
+    elevation, dolly) applied to the starting camera of every view, the
+    default is a full orbit. A .png/.jpg fileName writes an image sequence
+    (fileName_0000.png, ...), a .avi/.mp4 a video. Frames are captured on
+    the main thread and encoded on a worker thread through a bounded
+    queue, so at most queueSize frames are held in memory.
+    """
+    import threading, Queue
+
+    if not self.layoutGrid:
+      raise Exception('No mosaic to export, apply the mosaic viewer first')
+    if path is None:
+      path = self.orbitPath(nFrames)
+
+    writeFrame, closeWriter = self._frameWriter(fileName, frameRate)
+    frames = Queue.Queue(maxsize = queueSize)
+    errors = []
+
+    def encode():
+      try:
+        while True:
+          frame = frames.get()
+          if frame is None:
+            break
+          writeFrame(*frame)
+      except Exception, e:
+        errors.append(e)
+        # keep draining so that the capture never blocks on a full queue
+        while frames.get() is not None:
+          pass
+      finally:
+        closeWriter()
+
+    encoder = threading.Thread(target = encode, name = 'MosaicViewer encoder')
+    encoder.start()
+
+    # the starting pose of every view, each frame is computed from it to avoid drift
+    cameraIndex = self.getCameraIndex()
+    cameras     = []
+    for viewID in self.viewMap.values():
+      cam = cameraIndex.cameraForView(viewID)
+      if cam is not None:
+        start = vtk.vtkCamera()
+        start.DeepCopy(cam.GetCamera())
+        cameras.append((cam, start))
+
+    try:
+      for frame in range(nFrames):
+        azimuth, elevation, dolly = path(frame)
+        for cam, start in cameras:
+          self._moveCamera(cam, start, azimuth, elevation, dolly)
+        frames.put((frame, self.captureMosaic()))
+        if errors:
+          break
+    finally:
+      frames.put(None)
+      encoder.join()
+      self._releaseOffscreenTiles()
+      for cam, start in cameras:
+        self._moveCamera(cam, start, 0.0, 0.0, 1.0)
+
+    if errors:
+      raise errors[0]
+
+  # ------------------------------------------
+  def _moveCamera(self, cam, start, azimuth, elevation, dolly):
+    camera = vtk.vtkCamera()
+    camera.DeepCopy(start)
+    camera.Azimuth(azimuth)
+    camera.Elevation(elevation)
+    camera.OrthogonalizeViewUp()
+    camera.Dolly(dolly)
+    wasModifying = cam.StartModify()
+    cam.SetFocalPoint(camera.GetFocalPoint())
+    cam.SetPosition(camera.GetPosition())
+    cam.SetViewUp(camera.GetViewUp())
+    cam.EndModify(wasModifying)
+
+  # ------------------------------------------
+  def _frameWriter(self, fileName, frameRate):
+    """(writeFrame(frameIndex, image), close()) for an image sequence or a video file"""
+    root, extension = os.path.splitext(fileName)
+    extension       = extension.lower()
+
+    if extension in ('.png', '.jpg', '.jpeg'):
+      def writeFrame(frameIndex, image):
+        writer = vtk.vtkPNGWriter() if extension == '.png' else vtk.vtkJPEGWriter()
+        _setInput(writer, image)
+        writer.SetFileName('%s_%04d%s' % (root, frameIndex, extension))
+        writer.Write()
+      return writeFrame, lambda: None
+
+    if extension in ('.avi', '.mp4'):
+      if hasattr(vtk, 'vtkFFMPEGWriter'):
+        writer = vtk.vtkFFMPEGWriter()
+      elif extension == '.avi' and hasattr(vtk, 'vtkAVIWriter'):
+        writer = vtk.vtkAVIWriter()
+      else:
+        raise Exception('No video writer available in this VTK build, export an image sequence instead')
+      writer.SetFileName(fileName)
+      writer.SetRate(frameRate)
+      started = []
+      def writeFrame(frameIndex, image):
+        _setInput(writer, image)
+        if not started:
+          writer.Start()
+          started.append(True)
+        writer.Write()
+      def close():
+        if started:
+          writer.End()
+      return writeFrame, close
+
+    raise Exception('Unknown animation format: %s' % extension)
+
+  # ------------------------------------------
+  def stopRenderScheduler(self):
+    if self.renderScheduler is not None:
+      self.renderScheduler.stop()
+      self.renderScheduler = None
+
+  # ------------------------------------------
+  def cleanup(self, keepMosaic = False):
+    """
+    Remove the observers this logic added to the scene. Unless keepMosaic,
+    also remove the nodes it added for the mosaic; with keepMosaic they are
+    handed over through mosaicSnapshot instead.
+    """
+    self.stopRenderScheduler()
+    self._releaseOffscreenTiles()
+    if self.cameraIndex is not None:
+      self.cameraIndex.cleanup()
+      self.cameraIndex = None
+    if not keepMosaic and self.slicePlanePool is not None:
+      self.slicePlanePool.cleanup()
+      self.slicePlanePool = None
+    if keepMosaic:
+      self._removeFiberFocusObservers()
+    else:
+      self.removeFiberBudgets()
+
+  # ------------------------------------------
+  def getCameraIndex(self):
+    if self.cameraIndex is None:
+      self.cameraIndex = MosaicCameraIndex(slicer.mrmlScene)
+    return self.cameraIndex
+
+  # ------------------------------------------
+  def _viewID(self, view):
+    """accept a view node, a view node ID or the name of a view of the mosaic"""
+    if not isinstance(view, basestring):
+      return view.GetID()
+    return self.viewMap.get(view, view)
+
+  # ------------------------------------------
+  def addSyncGroup(self, name, views):
+    """
+    Link a subset of the views: syncCam on any of them only updates the
+    others of the group
+    """
+    self.syncGroups[name] = [self._viewID(v) for v in views]
+
+  # ------------------------------------------
+  def removeSyncGroup(self, name):
+    self.syncGroups.pop(name, None)
+
+  # ------------------------------------------
+  def linkView(self, name, view):
+    """move a view to the sync group name, creating the group if needed"""
+    self.unlinkView(view)
+    self.syncGroups.setdefault(name, []).append(self._viewID(view))
+
+  # ------------------------------------------
+  def unlinkView(self, view):
+    """take a view out of its sync groups, dropping the groups left empty"""
+    viewID = self._viewID(view)
+    for name in self.syncGroups.keys():
+      if viewID in self.syncGroups[name]:
+        self.syncGroups[name].remove(viewID)
+      if not self.syncGroups[name]:
+        del self.syncGroups[name]
+
+  # ------------------------------------------
+  def syncGroupOf(self, view):
+    """name of the first sync group containing the view, None if it is in none"""
+    viewID = self._viewID(view)
+    for name in sorted(self.syncGroups.keys()):
+      if viewID in self.syncGroups[name]:
+        return name
+    return None
+
+  # ------------------------------------------
+  def syncCam(self, viewNode, group = None, mode = 'all'):
+    """
+    Apply the camera of viewNode to the other views of its sync group.
+    Without a group the views of the mosaic are synchronised (every view
+    of the scene when no mosaic has been built).
+    mode is one of syncModes: 'all' copies the full camera pose, 'rotation'
+    only the orientation and 'zoom' only the distance to the focal point.
+    """
+    if mode not in self.syncModes:
+      raise ValueError('Unknown sync mode: %s' % mode)
+
+    cameraIndex = self.getCameraIndex()
+    viewID      = self._viewID(viewNode)
+    cam2apply   = cameraIndex.cameraForView(viewID)
 
     if cam2apply == None:
       raise Exception('No camera node is attached to this view')
 
-    for i in range(ncam):
-        cam = sceneCameraCollection.GetItemAsObject(i)
-        atag = cam.GetActiveTag()
-        if atag != cam2apply.GetActiveTag():
-          cam.Copy(cam2apply)
-          cam.SetActiveTag(atag) # Restore the previous active tag
-          cam.UpdateScene(scene)
+    if group is None:
+      group = self.syncGroupOf(viewID)
+    if group is not None:
+      targetViewIDs = self.syncGroups[group]
+    elif self.viewMap:
+      targetViewIDs = self.viewMap.values()
+    else:
+      targetViewIDs = cameraIndex.cameras.keys()
+
+    for targetViewID in targetViewIDs:
+      if targetViewID == viewID:
+        continue
+      cam = cameraIndex.cameraForView(targetViewID)
+      if cam is not None:
+        self._copyCamera(cam2apply, cam, mode)
+
+  # ------------------------------------------
+  def _copyCamera(self, source, target, mode):
+    wasModifying = target.StartModify()
+    if mode == 'all':
+      target.SetFocalPoint(source.GetFocalPoint())
+      target.SetPosition(source.GetPosition())
+      target.SetViewUp(source.GetViewUp())
+      target.SetViewAngle(source.GetViewAngle())
+      target.SetParallelProjection(source.GetParallelProjection())
+      target.SetParallelScale(source.GetParallelScale())
+    else:
+      # keep the focal point of the target, move it along the new direction
+      if mode == 'rotation':
+        direction = source.GetCamera().GetDirectionOfProjection()
+        distance  = target.GetCamera().GetDistance()
+        target.SetViewUp(source.GetViewUp())
+      else:
+        direction = target.GetCamera().GetDirectionOfProjection()
+        distance  = source.GetCamera().GetDistance()
+        target.SetParallelScale(source.GetParallelScale())
+      focalPoint = target.GetFocalPoint()
+      target.SetPosition([focalPoint[i] - distance * direction[i] for i in range(3)])
+    target.EndModify(wasModifying)
 
 
 # ================================================
@@ -700,7 +2407,7 @@ class MosaicViewerTest(unittest.TestCase):
     so that we'll know when it breaks.
     """
     print(message)
-    self.info = qt.Qdialog()
+    self.info = qt.QDialog()
     self.infoLayout = qt.QVBoxLayout()
     self.info.setLayout(self.infoLayout)
     self.label = qt.QLabel(message,self.info)
@@ -722,6 +2429,8 @@ class MosaicViewerTest(unittest.TestCase):
 
     if scenario   == "Volume":
       self.testMosaicViewerVolume()
+    elif scenario == 'state':
+      self.testMosaicViewerState()
     elif scenario == "Model":
       self.testMosaicViewerModel()
     elif scenario == 'sceneViewSimple':
@@ -731,6 +2440,23 @@ class MosaicViewerTest(unittest.TestCase):
     elif scenario == 'syncCam':
       self.testMosaicViewerSceneView('SeneView_Complex')      
       self.testMosaicViewerSyncCam()      
+    elif scenario == 'reloadKeepMosaic':
+      self.testMosaicViewerReloadKeepMosaic()
+    elif scenario == 'syncGroup':
+      self.testMosaicViewerSceneView('SeneView_Simple')
+      self.testMosaicViewerSyncGroup()
+    elif scenario == 'session':
+      self.testMosaicViewerSession()
+    elif scenario == 'renderScheduler':
+      self.testMosaicViewerRenderScheduler()
+    elif scenario == 'sharedSlices':
+      self.testMosaicViewerSharedSlices()
+    elif scenario == 'fibers':
+      self.testMosaicViewerFiberCache()
+    elif scenario == 'animation':
+      self.testMosaicViewerAnimation()
+    elif scenario == 'visibility':
+      self.testMosaicViewerVisibilityMatrix()
     elif scenario == 'All':
       self.testMosaicViewerAll()
     else:
@@ -758,7 +2484,7 @@ class MosaicViewerTest(unittest.TestCase):
     fPath = eval('slicer.modules.mosaicviewer.path')
     fdir = os.path.dirname(fPath) + '/Resources/SampleVolumes'
 
-    for f in os.listdisr(fdir):
+    for f in os.listdir(fdir):
       if f.endswith(".nrrd"):
           slicer.util.loadVolume(fdir + '/' + f)
           fName, fExtension = os.path.splitext(f)
@@ -783,7 +2509,7 @@ class MosaicViewerTest(unittest.TestCase):
 
     fdir = os.path.dirname(fPath) + '/Resources/SampleModels'
 
-    for f in os.listdisr(fdir):
+    for f in os.listdir(fdir):
       if f.endswith(".vtk"):
           slicer.util.loadModel(fdir + '/' + f)
           fName, fExtension = os.path.splitext(f)
@@ -796,6 +2522,17 @@ class MosaicViewerTest(unittest.TestCase):
 
   # -------------------------------------
   def testMosaicViewerSceneView(self, subScenario):
+    self.loadSampleSceneViews(subScenario)
+
+    # detach the logic of the previous scenario from the scene
+    if getattr(self, 'sceneViewLogic', None) is not None:
+      self.sceneViewLogic.cleanup()
+    logic = MosaicViewerLogic()
+    logic.renderAllSceneViewNodes()
+    self.sceneViewLogic = logic
+    return logic
+
+  def loadSampleSceneViews(self, subScenario):
     
     self.setUp()
 
@@ -813,7 +2550,7 @@ class MosaicViewerTest(unittest.TestCase):
     elif subScenario == 'SeneView_Complex':
       fdir = os.path.dirname(fPath) + '/Resources/SampleSceneViewsComplex'
 
-    for f in os.listdisr(fdir):
+    for f in os.listdir(fdir):
       if f.endswith(".mrb"):
         slicer.util.loadScene(fdir + '/' + f)
         fName, fExtension = os.path.splitext(f)
@@ -821,8 +2558,78 @@ class MosaicViewerTest(unittest.TestCase):
         sceneViews.append(slicer.util.getNode(fName))
         svNames.append(fName)
 
-    logic = MosaicViewerLogic()
-    logic.renderAllSceneViewNodes()
+  def testMosaicViewerReloadKeepMosaic(self):
+    self.loadSampleSceneViews('SeneView_Simple')
+    # the widget of the module panel, replaced by every reload
+    widget = globals().get('mosaicviewerwidget', slicer.modules.MosaicViewerWidget)
+    widget.state.update({'layoutMethod' : 'Customized', 'nRows' : 2, 'nColumns' : 2})
+    widget.onApply()
+
+    scene         = slicer.mrmlScene
+    viewNodes     = scene.GetNodesByClass('vtkMRMLViewNode')
+    viewNodeIDs   = sorted([viewNodes.GetItemAsObject(v).GetID() for v in range(viewNodes.GetNumberOfItems())])
+    viewMap       = dict(widget.logic.viewMap)
+    threeDViewMap = dict(widget.logic.threeDViewMap)
+    stateValues   = widget.state.toDict()
+    self.assertTrue(len(threeDViewMap) > 0)
+
+    # a pending live preview must not fire on the logic of the old widget
+    widget.previewTimer.start()
+    self.delaydissplay('Reload the module and keep the mosaic', 2000)
+    widget.onReload(keepMosaic = True)
+    self.assertFalse(widget.previewTimer.active)
+
+    reloaded = globals()['mosaicviewerwidget']
+    self.assertFalse(reloaded is widget)
+    self.assertEqual(reloaded.state.toDict(), stateValues)
+    self.assertEqual(reloaded.logic.viewMap, viewMap)
+    self.assertEqual(sorted(reloaded.logic.threeDViewMap.keys()), sorted(threeDViewMap.keys()))
+    for viewName, threeDView in threeDViewMap.items():
+      self.assertTrue(reloaded.logic.threeDViewMap[viewName] is threeDView)
+    viewNodes = scene.GetNodesByClass('vtkMRMLViewNode')
+    self.assertEqual(sorted([viewNodes.GetItemAsObject(v).GetID() for v in range(viewNodes.GetNumberOfItems())]),
+                     viewNodeIDs)
+
+    # Restore Defaults resets the parameters in place, the mosaic is left alone
+    state = reloaded.state
+    reloaded.onRestore()
+    self.assertTrue(reloaded.state is state)
+    self.assertEqual(reloaded.state.toDict(), MosaicViewerState().toDict())
+    self.assertEqual(reloaded.chooseRowSlider.value, 1)
+    self.assertEqual(reloaded.logic.viewMap, viewMap)
+    self.assertEqual(scene.GetNodesByClass('vtkMRMLViewNode').GetNumberOfItems(), len(viewNodeIDs))
+
+  def testMosaicViewerState(self):
+    state   = MosaicViewerState()
+    changes = []
+    state.addObserver(lambda name, value: changes.append((name, value)))
+
+    # the sliders and spin boxes give floats, rounded for the int fields
+    state.nRows = 2.6
+    self.assertEqual(state.nRows, 3)
+    self.assertTrue(isinstance(state.nRows, int))
+    self.assertEqual(changes, [('nRows', 3)])
+
+    # no notification when the value does not change
+    state.nRows = 3.0
+    state.update({'nRows' : 3, 'livePreview' : False})
+    self.assertEqual(changes, [('nRows', 3)])
+
+    state.update({'layoutMethod' : 'Customized', 'nColumns' : 4, 'idleRate' : 5, 'subsampleFibers' : True})
+    state.reset()
+    for fieldName, fieldType, default in MosaicViewerState.fields:
+      self.assertEqual(getattr(state, fieldName), default)
+
+    # a slider updates its spin box without echoing back into the state
+    widget  = MosaicViewerWidget()
+    changes = []
+    widget.state.addObserver(lambda name, value: changes.append((name, value)))
+    widget.chooseRowSlider.value = 4
+    self.assertEqual(widget.state.nRows, 4)
+    self.assertEqual(widget.chooseRowSliderSpinBox.value, 4)
+    self.assertEqual(changes, [('nRows', 4)])
+    widget.cleanup()
+    widget.parent.close()
 
   def testMosaicViewerSyncCam(self):
     import random
@@ -855,3 +2662,362 @@ class MosaicViewerTest(unittest.TestCase):
       self.delaydissplay('Sync all to view %d' % vidx, 2000)
       cam2disstort.UpdateScene(scene)
       logic.syncCam(view)
+    logic.cleanup()
+
+  def testMosaicViewerSyncGroup(self):
+    import random
+
+    scene = slicer.mrmlScene
+    views = scene.GetNodesByClass('vtkMRMLViewNode')
+    self.assertTrue(views.GetNumberOfItems() >= 3)
+    view1 = views.GetItemAsObject(0)
+    view2 = views.GetItemAsObject(1)
+    view3 = views.GetItemAsObject(2)
+
+    logic       = MosaicViewerLogic()
+    cameraIndex = logic.getCameraIndex()
+    logic.addSyncGroup('linked', [view1, view2])
+    self.assertEqual(logic.syncGroupOf(view2), 'linked')
+    self.assertEqual(logic.syncGroupOf(view3), None)
+
+    cam1 = cameraIndex.cameraForView(view1)
+    cam2 = cameraIndex.cameraForView(view2)
+    cam3 = cameraIndex.cameraForView(view3)
+    position3 = cam3.GetPosition()
+
+    cam1.SetPosition(random.uniform(0,500), random.uniform(0,500), random.uniform(0,500))
+    self.delaydissplay('Sync the rotation of view 1 to its group', 2000)
+    logic.syncCam(view1, mode = 'rotation')
+
+    direction1 = cam1.GetCamera().GetDirectionOfProjection()
+    direction2 = cam2.GetCamera().GetDirectionOfProjection()
+    for i in range(3):
+      self.assertAlmostEqual(direction1[i], direction2[i], places = 5)
+      self.assertAlmostEqual(position3[i], cam3.GetPosition()[i], places = 5)
+
+    # the full camera, view angle included, in 'all' mode
+    viewAngle3 = cam3.GetViewAngle()
+    cam1.SetViewAngle(viewAngle3 + 10)
+    logic.syncCam(view1)
+    self.assertAlmostEqual(cam2.GetViewAngle(), viewAngle3 + 10, places = 5)
+    self.assertAlmostEqual(cam3.GetViewAngle(), viewAngle3, places = 5)
+
+    # what the Link View and Unlink View buttons do
+    logic.linkView('linked', view3)
+    self.assertEqual(logic.syncGroupOf(view3), 'linked')
+    logic.linkView('other', view2)
+    self.assertEqual(logic.syncGroupOf(view2), 'other')
+    self.assertEqual(logic.syncGroups['linked'], [view1.GetID(), view3.GetID()])
+    logic.unlinkView(view2)
+    self.assertEqual(logic.syncGroupOf(view2), None)
+    self.assertFalse('other' in logic.syncGroups)
+    logic.linkView('linked', view2)
+
+    # the sync groups survive a reload of the module
+    reloaded = MosaicViewerLogic()
+    reloaded.restoreMosaicSnapshot(logic.mosaicSnapshot())
+    self.assertEqual(reloaded.syncGroupOf(view2), 'linked')
+    logic.cleanup()
+    reloaded.cleanup()
+
+  def testMosaicViewerSession(self):
+    import tempfile, json, random
+
+    logic    = self.testMosaicViewerSceneView('SeneView_Simple')
+    scene    = slicer.mrmlScene
+    fileName = os.path.join(tempfile.gettempdir(), 'MosaicViewerSession.json')
+    logic.exportSession(fileName)
+
+    f = open(fileName, 'r')
+    session = json.load(f)
+    f.close()
+
+    # the views showing each exported display
+    shownIn = {} # Display Node ID -> set of View Names
+    for view in session['views']:
+      for displayID in view['displayIDs']:
+        shownIn.setdefault(displayID, set()).add(view['name'])
+      for displayID in view['hiddenDisplayIDs']:
+        shownIn.setdefault(displayID, set())
+    self.assertTrue(len([names for names in shownIn.values() if names]) > 0)
+    # e.g. the tube and glyph displays of the tractography
+    self.assertTrue(len([names for names in shownIn.values() if not names]) > 0)
+
+    cameraIndex = logic.getCameraIndex()
+    cameras     = {} # View Name -> (position, view angle) at export
+    for viewName, viewID in logic.viewMap.items():
+      cam = cameraIndex.cameraForView(viewID)
+      cameras[viewName] = (cam.GetPosition(), cam.GetViewAngle())
+
+    # move every camera and show every display in every view
+    for viewName, viewID in logic.viewMap.items():
+      cam = cameraIndex.cameraForView(viewID)
+      cam.SetPosition(random.uniform(0,500), random.uniform(0,500), random.uniform(0,500))
+      cam.SetViewAngle(cameras[viewName][1] + 10)
+    for displayID in shownIn:
+      displayNode = scene.GetNodeByID(displayID)
+      for viewID in [displayNode.GetViewNodeID(v) for v in range(displayNode.GetNumberOfViewNodeIDs())]:
+        displayNode.RemoveViewNodeID(viewID)
+      displayNode.SetVisibility(1)
+
+    self.delaydissplay('Reopen the exported mosaic session', 2000)
+    reopened = MosaicViewerLogic()
+    reopened.loadSession(fileName, loadScene = False)
+    self.assertEqual(reopened.viewSceneViews, logic.viewSceneViews)
+    for viewName in reopened.viewSceneViews:
+      self.assertEqual(set(reopened.visibilityMatrix.displaysIn(viewName)),
+                       set([displayID for displayID, viewNames in shownIn.items() if viewName in viewNames]))
+
+    for displayID, viewNames in shownIn.items():
+      displayNode = scene.GetNodeByID(displayID)
+      viewIDs     = [displayNode.GetViewNodeID(v) for v in range(displayNode.GetNumberOfViewNodeIDs())]
+      for viewName, viewID in reopened.viewMap.items():
+        shown = bool(displayNode.GetVisibility()) and (not viewIDs or viewID in viewIDs)
+        self.assertEqual(shown, viewName in viewNames)
+
+    for viewName, (position, viewAngle) in cameras.items():
+      cam = reopened.getCameraIndex().cameraForView(reopened.viewMap[viewName])
+      for i in range(3):
+        self.assertAlmostEqual(position[i], cam.GetPosition()[i], places = 3)
+      self.assertAlmostEqual(viewAngle, cam.GetViewAngle(), places = 3)
+    os.remove(fileName)
+    logic.cleanup()
+    reopened.cleanup()
+
+  def testMosaicViewerRenderScheduler(self):
+    logic     = self.testMosaicViewerSceneView('SeneView_Simple')
+    scheduler = logic.startRenderScheduler(idleRate = 1.0)
+    self.assertTrue(scheduler is not None)
+
+    # a display shown in several idle views is rendered once per view and flush
+    displayNodes = slicer.mrmlScene.GetNodesByClass('vtkMRMLModelDisplayNode')
+    self.assertTrue(displayNodes.GetNumberOfItems() > 0)
+    displayNode = displayNodes.GetItemAsObject(0)
+    for i in range(5):
+      displayNode.SetOpacity(0.1 * (i + 1))
+    nViews = len(scheduler._viewNamesOf(displayNode))
+    scheduler.flush()
+
+    counters = scheduler.counters()
+    self.assertEqual(counters['performed'], nViews)
+    self.assertEqual(counters['avoided'], 4 * nViews)
+    self.assertEqual(counters['skipped'], len(logic.threeDViewMap) - nViews)
+
+    # 'onRelease': nothing is flushed while an interaction is in progress
+    scheduler = logic.startRenderScheduler(mode = 'onRelease')
+    viewName  = sorted(logic.threeDViewMap.keys())[0]
+    style     = logic.threeDViewMap[viewName].interactor().GetInteractorStyle()
+    style.InvokeEvent(vtk.vtkCommand.StartInteractionEvent)
+    self.assertTrue(scheduler.interacting)
+
+    displayNode.SetOpacity(1.0)
+    self.assertFalse(scheduler.timer.active)
+    slicer.app.processEvents()
+    scheduler.flush()
+    self.assertEqual(scheduler.counters()['performed'], 0)
+
+    nDirty = len(scheduler.dirty)
+    self.assertTrue(nDirty > 0)
+    style.InvokeEvent(vtk.vtkCommand.EndInteractionEvent)
+    self.assertFalse(scheduler.interacting)
+    self.assertEqual(scheduler.counters()['performed'], nDirty)
+    logic.cleanup()
+
+  def testMosaicViewerSharedSlices(self):
+    self.testMosaicViewerSceneView('SeneView_Simple')
+    scene = slicer.mrmlScene
+    pool  = MosaicSlicePlanePool(scene)
+
+    def redNodes(sceneView):
+      sliceNode, compositeNode = None, None
+      for className in ('vtkMRMLSliceNode', 'vtkMRMLSliceCompositeNode'):
+        collection = sceneView.GetNodesByClass(className)
+        for n in range(collection.GetNumberOfItems()):
+          node = collection.GetItemAsObject(n)
+          if node.GetLayoutName() == 'Red':
+            if className == 'vtkMRMLSliceNode':
+              sliceNode = node
+            else:
+              compositeNode = node
+      return sliceNode, compositeNode
+
+    # the red slice is at the same position in every sample scene view: one plane for all
+    sceneViews = [n for n in slicer.util.getNodes('*vtkMRMLSceneViewNode*').values() if "Slice" not in n.GetName()]
+    self.assertTrue(len(sceneViews) >= 2)
+    planeIDs = set()
+    for sceneView in sceneViews:
+      svSliceNode, svCompositeNode = redNodes(sceneView)
+      planeIDs.add(pool.planeFor(svSliceNode, svCompositeNode).GetID())
+    self.assertEqual(len(planeIDs), 1)
+    nSliceLogics = len(pool.sliceLogics)
+    self.assertTrue(nSliceLogics <= 1)
+
+    # a moved position gets its own slice logic, shared by every view showing it
+    moved = slicer.vtkMRMLSliceNode()
+    moved.Copy(svSliceNode)
+    sliceToRAS = moved.GetSliceToRAS()
+    sliceToRAS.SetElement(2, 3, sliceToRAS.GetElement(2, 3) + 10)
+    movedPlane = pool.planeFor(moved, svCompositeNode)
+    self.assertFalse(movedPlane.GetID() in planeIDs)
+    self.assertEqual(len(pool.sliceLogics), nSliceLogics + 1)
+    self.assertTrue(movedPlane.GetLayoutName().startswith('Mosaic'))
+    self.assertEqual(pool.planeFor(moved, svCompositeNode).GetID(), movedPlane.GetID())
+    self.assertEqual(len(pool.sliceLogics), nSliceLogics + 1)
+
+    # a session saves the position of the plane and rebuilds it with a new pool
+    self.assertTrue(pool.describePlane(scene.GetNodeByID(svSliceNode.GetID())) is None)
+    description = pool.describePlane(movedPlane)
+    movedKey    = pool.planeKey(movedPlane, pool.sliceLogics[-1].GetSliceCompositeNode())
+    rebuiltPool = MosaicSlicePlanePool(scene)
+    rebuilt     = rebuiltPool.planeFromDescription(description)
+    self.assertFalse(rebuilt.GetID() == movedPlane.GetID())
+    self.assertEqual(rebuiltPool.planeKey(rebuilt, rebuiltPool.sliceLogics[0].GetSliceCompositeNode()), movedKey)
+    rebuiltID = rebuilt.GetID()
+    rebuiltPool.cleanup()
+    self.assertTrue(scene.GetNodeByID(rebuiltID) is None)
+
+    movedPlaneID = movedPlane.GetID()
+    pool.cleanup()
+    self.assertTrue(scene.GetNodeByID(movedPlaneID) is None)
+
+  def testMosaicViewerFiberCache(self):
+    fPath = eval('slicer.modules.mosaicviewer.path')
+    fdir  = os.path.dirname(fPath) + '/Resources/SampleModels'
+    slicer.util.loadModel(fdir + '/CST-R.vtk')
+    bundle = slicer.util.getNode('CST-R')
+
+    cache = MosaicFiberCache()
+    self.assertTrue(cache.isTractography(bundle))
+    budget     = MosaicFiberCache.minBudget
+    self.assertTrue(bundle.GetPolyData().GetNumberOfLines() > budget)
+    subsampled = cache.subsample(bundle, budget)
+    self.assertTrue(0 < subsampled.GetNumberOfLines() <= budget)
+    # cached until the bundle changes
+    self.assertTrue(cache.subsample(bundle, budget) is subsampled)
+    bundle.GetPolyData().Modified()
+    self.assertFalse(cache.subsample(bundle, budget) is subsampled)
+
+    # the corpus callosum of the sample scene views is above the smallest budget
+    logic = self.testMosaicViewerSceneView('SeneView_Simple')
+    scene = slicer.mrmlScene
+    logic.fibersPerMegapixel = 1
+    logic.applyFiberBudgets()
+    self.assertTrue(len(logic.fiberTiles) > 0)
+    viewName   = sorted(logic.fiberTiles.keys())[0]
+    viewID     = logic.viewMap[viewName]
+    interactor = logic.threeDViewMap[viewName].interactor()
+
+    def shown(displayNode):
+      viewIDs = [displayNode.GetViewNodeID(v) for v in range(displayNode.GetNumberOfViewNodeIDs())]
+      return bool(displayNode.GetVisibility()) and (not viewIDs or viewID in viewIDs)
+
+    # the proxy takes the view from the bundle
+    for displayNode, proxy in logic.fiberTiles[viewName]:
+      self.assertTrue(proxy.GetPolyData().GetNumberOfLines() <= MosaicFiberCache.minBudget)
+      self.assertTrue(shown(proxy.GetDisplayNode()))
+      self.assertFalse(shown(displayNode))
+
+    # the tile under the mouse gets the full bundle back, without the render scheduler
+    self.assertTrue(logic.renderScheduler is None)
+    interactor.InvokeEvent(vtk.vtkCommand.EnterEvent)
+    self.assertEqual(logic.focusedFiberTile, viewName)
+    for displayNode, proxy in logic.fiberTiles[viewName]:
+      self.assertTrue(shown(displayNode))
+      self.assertFalse(shown(proxy.GetDisplayNode()))
+    interactor.InvokeEvent(vtk.vtkCommand.LeaveEvent)
+    self.assertEqual(logic.focusedFiberTile, None)
+    for displayNode, proxy in logic.fiberTiles[viewName]:
+      self.assertFalse(shown(displayNode))
+
+    displayNodes = [displayNode for displayNode, proxy in logic.fiberTiles[viewName]]
+    proxyIDs     = [proxy.GetID() for proxy in logic.fiberProxies.values()]
+    logic.removeFiberBudgets()
+    for proxyID in proxyIDs:
+      self.assertTrue(scene.GetNodeByID(proxyID) is None)
+    for displayNode in displayNodes:
+      self.assertTrue(shown(displayNode))
+      self.assertTrue(displayNode.GetNumberOfViewNodeIDs() > 0)
+    logic.cleanup()
+
+  def testMosaicViewerAnimation(self):
+    import tempfile, shutil
+
+    logic = self.testMosaicViewerSceneView('SeneView_Simple')
+    viewID = logic.viewMap.values()[0]
+    position = logic.getCameraIndex().cameraForView(viewID).GetPosition()
+
+    # the size of the mosaic: the widest row by the rows stacked
+    width, height = 0, 0
+    for row in logic.layoutGrid:
+      sizes  = [logic.threeDViewMap[viewName].renderWindow().GetSize() for viewName in row
+                if viewName in logic.threeDViewMap]
+      if sizes:
+        width  = max(width, sum([size[0] for size in sizes]))
+        height = height + max([size[1] for size in sizes])
+
+    outputDir = tempfile.mkdtemp()
+    try:
+      logic.exportAnimation(os.path.join(outputDir, 'orbit.png'), nFrames = 4)
+      frames = sorted(os.listdir(outputDir))
+      self.assertEqual(frames, ['orbit_%04d.png' % i for i in range(4)])
+
+      pixels = []
+      for frame in (frames[0], frames[2]):
+        reader = vtk.vtkPNGReader()
+        reader.SetFileName(os.path.join(outputDir, frame))
+        reader.Update()
+        image  = reader.GetOutput()
+        self.assertEqual(image.GetDimensions()[:2], (width, height))
+        scalars = image.GetPointData().GetScalars()
+        pixels.append([scalars.GetTuple(i) for i in range(0, scalars.GetNumberOfTuples(), 97)])
+      # not a blank frame: the models turn between the first and the third frame
+      self.assertTrue(len(set(pixels[0])) > 1)
+      self.assertNotEqual(pixels[0], pixels[2])
+    finally:
+      shutil.rmtree(outputDir)
+
+    # the cameras are back at their starting pose
+    restored = logic.getCameraIndex().cameraForView(viewID).GetPosition()
+    for i in range(3):
+      self.assertAlmostEqual(position[i], restored[i], places = 3)
+
+  def testMosaicViewerVisibilityMatrix(self):
+    logic  = self.testMosaicViewerSceneView('SeneView_Simple')
+    matrix = logic.visibilityMatrix
+    scene  = slicer.mrmlScene
+    self.assertEqual(matrix.visible.shape, (len(matrix.viewNames), len(matrix.displayIDs)))
+
+    # once applied the scene matches the matrix and nothing is left to apply
+    rows, columns = matrix.diff(matrix.current(scene, logic.viewMap))
+    self.assertEqual(len(rows), 0)
+    self.assertEqual(matrix.apply(scene, logic.viewMap), 0)
+
+    for viewName in matrix.viewNames:
+      for displayID in matrix.displaysIn(viewName):
+        self.assertTrue(viewName in matrix.viewsShowing(displayID))
+      for structure in matrix.structuresIn(viewName):
+        self.assertTrue(viewName in matrix.viewsShowing(structure))
+
+    # a display hidden in every scene view is hidden, even with an empty view list
+    import numpy
+    nViews      = len(matrix.viewNames)
+    displayID   = matrix.displayIDs[0]
+    displayNode = scene.GetNodeByID(displayID)
+    for viewID in [displayNode.GetViewNodeID(v) for v in range(displayNode.GetNumberOfViewNodeIDs())]:
+      displayNode.RemoveViewNodeID(viewID)
+    displayNode.SetVisibility(1)
+    hidden = MosaicVisibilityMatrix(matrix.viewNames, [displayID],
+                                    numpy.zeros((nViews, 1), dtype = bool), numpy.ones((nViews, 1), dtype = bool))
+    self.assertTrue(hidden.current(scene, logic.viewMap).all())
+    self.assertEqual(hidden.apply(scene, logic.viewMap), nViews)
+    self.assertFalse(displayNode.GetVisibility())
+    self.assertEqual(hidden.apply(scene, logic.viewMap), 0)
+
+    # the queries survive Reload (Keep Mosaic)
+    reloaded = MosaicViewerLogic()
+    reloaded.restoreMosaicSnapshot(logic.mosaicSnapshot())
+    self.assertTrue(reloaded.visibilityMatrix is matrix)
+    for viewName in matrix.viewNames:
+      self.assertEqual(reloaded.visibilityMatrix.structuresIn(viewName), matrix.structuresIn(viewName))
+    logic.cleanup(keepMosaic = True)
+    reloaded.cleanup()